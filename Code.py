@@ -8,99 +8,71 @@
 """
 
 
+import os
+from functools import partial
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.preprocessing import StandardScaler
+from backends import benchmark_backends, check_engine, gbdt_params, make_model
+from evaluation import ModelEvaluation, write_metrics
+from export import export_table
+from feature_store import FeatureStore
+from features import build_final_database
+from geo import zip_centroids
+from oversampling import FastSMOTE
+from preprocessing import ModelMatrixTransformer, load_vocabulary
+from trial_store import TrialStore, data_digest
+from tuning import (FoldCache, MedianPruner, best_trial, cross_val_result, halving_search, parallel_fmin,
+                    split_cores, with_resampler, xgb_cross_val_result)
+from ids import IdDictionary
+from loading import load_table
+from profiling import profile_table
+from quality_report import draw_profile, render_profiles
+from spatial_index import fill_missing_prefixes, seller_index
+
+# Set SHOW_PLOTS=0 for batch runs: no interactive figures, only the data-quality report file
+SHOW_PLOTS = os.environ.get("SHOW_PLOTS", "1") != "0"
 
 # Loading data
 
-Customers=pd.read_csv("olist_customers_dataset.csv")
-Geolocation=pd.read_csv("olist_geolocation_dataset.csv")
-Order_items=pd.read_csv("olist_order_items_dataset.csv")
-Order_Payments=pd.read_csv("olist_order_payments_dataset.csv")
-Order_Reviews=pd.read_csv("olist_order_reviews_dataset.csv")
-Order_Status=pd.read_csv("olist_orders_dataset.csv")
-Products=pd.read_csv("olist_products_dataset.csv")
-Sellers=pd.read_csv("olist_sellers_dataset.csv")
-Product_Translations=pd.read_csv("product_category_name_translation.csv")
-
-# Defining a function to calculate the number of working days between purchase and delivery
-
-def calculate_working_days(start, end):
-    # Handle missing values
-    if pd.isna(start) or pd.isna(end):
-        return None
-    # Calculate working days using numpy.busday_count
-    return np.busday_count(start.date(), end.date())
-
-def plot_total_missing_unique_values(db,db_name):
+# Each table is read with its declared schema (see loading.SCHEMAS): dates are parsed at read time,
+# low-cardinality text is categorical, and later runs read the Parquet copy in .olist_cache
+# The 32-character hex IDs (order_id, customer_id, product_id...) are replaced by int32 codes from one
+# dictionary shared by all tables and kept in id_dictionary.parquet, so the codes are the same every run
+ids = IdDictionary("id_dictionary.parquet")
+Customers=load_table("Customers", ids=ids)
+Geolocation=load_table("Geolocation")
+Order_items=load_table("Order_items", ids=ids)
+Order_Payments=load_table("Order_Payments", ids=ids)
+Order_Reviews=load_table("Order_Reviews", ids=ids)
+Order_Status=load_table("Order_Status", ids=ids)
+Products=load_table("Products", ids=ids)
+Sellers=load_table("Sellers", ids=ids)
+Product_Translations=load_table("Product_Translations")
+ids.save()
+
+def plot_total_missing_unique_values(profile):
     
     # Visualise missing values and unique values
+    # Headless runs skip the interactive figure; all profiles are rendered once in render_profiles below
+    if not SHOW_PLOTS:
+        return
 
-    # Calculate metrics
-    total_rows = len(db)  # Total rows
-    column_names = db.columns
-
-    # Create DataFrame to hold the statistics
-    stats = pd.DataFrame({
-        'Column': column_names,
-        'Total_Rows': total_rows,
-        'Non_Missing_Values': db.notnull().sum().values,
-        'Unique_Values': db.nunique().values
-    })
-
-    # Add Missing Rows
-    stats['Missing_Values'] = stats['Total_Rows'] - stats['Non_Missing_Values']
-
-    # Plot a stacked bar chart
-    plt.figure(figsize=(12, 7))
-
-    # Calculate bottom positions for stacking
-    bottom_non_missing = stats['Non_Missing_Values']
-    bottom_missing = stats['Non_Missing_Values'] + stats['Missing_Values']
-
-    # Plot Non-Missing Rows (this will form the bottom part of the bar)
-    bars_non_missing = plt.bar(stats['Column'], stats['Non_Missing_Values'], label='Duplicated Values', color='lightsteelblue', edgecolor='black')
-
-    # Plot Missing Rows on top of Non-Missing Rows
-    bars_missing = plt.bar(stats['Column'], stats['Missing_Values'], label='Missing Values', bottom=bottom_non_missing, color='gainsboro', edgecolor='black')
-
-    # Plot Unique Values on top of Non-Missing Rows (this segment will show within the Non-Missing Rows)
-    bars_unique = plt.bar(stats['Column'], stats['Unique_Values'], label='Unique Values', bottom=0, color='cornflowerblue', alpha=0.7, edgecolor='black')
-
-    # Add labels and title
-    plt.title(f'Total Rows, Duplicated, Missing, and Unique Values by Column in {db_name}', fontsize=16, fontweight='bold')
-    plt.xlabel('Column', fontsize=14)
-    plt.ylabel('Count', fontsize=14)
-    plt.xticks(rotation=45, fontsize=12)
-
-    # Place the legend to the right of the chart
-    plt.legend(title='Metric', fontsize=12, loc='center left', bbox_to_anchor=(1, 0.5))
-
-    # Add count and percentage labels to the bars
-    # for bar, value, bottom in zip(bars_non_missing, stats['Non_Missing_Rows'], [0] * len(stats['Non_Missing_Rows'])):
-    #     count = value
-    #     percentage = (value / total_rows) * 100
-    #     plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() / 2,
-    #              f'{count}\n({percentage:.2f}%)', ha='center', va='center', color='black')
-
-    for bar, value, bottom in zip(bars_unique, stats['Unique_Values'], [0] * len(stats['Unique_Values'])):
-        count = value
-        percentage = (value / total_rows) * 100
-        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() / 2,
-                 f'{count}\n({percentage:.2f}%)', ha='center', va='center', color='black')
+    # Plot a stacked bar chart of the metrics computed by profile_table
+    fig, ax = plt.subplots(figsize=(12, 7))
+    draw_profile(ax, profile)
 
     # Adjust layout to avoid clipping
-    plt.tight_layout()
+    fig.tight_layout()
 
     # Show the plot
     plt.show()
 
     # Print Table for Reference
-    print(stats)
+    print(profile.stats)
 
 
 # DATABASES:
@@ -136,8 +108,11 @@ Customers.info()
 # dtypes: int64(1), object(4)
 # memory usage: 3.8+ MB
 
+## Profiling Customers in a single pass: missing, duplicated and unique values from one factorization per column
+Customers_profile = profile_table(Customers, "Customers")
+
 ## Checking Missing values
-Customers.isnull().sum()
+Customers_profile.missing
 
 # Result in console:
 # customer_id                 0
@@ -150,7 +125,7 @@ Customers.isnull().sum()
 ## There aren't missing values
 
 ## Checking %Missing values
-round(Customers.isnull().sum()/len(Customers) * 100,3)
+Customers_profile.pct(Customers_profile.missing)
 
 # Result in console:
 # customer_id                 0.0
@@ -163,14 +138,14 @@ round(Customers.isnull().sum()/len(Customers) * 100,3)
 ## There is 0% of missing values.
 
 ## Checking Duplicates in all rows
-Customers.duplicated().value_counts()
+Customers_profile.row_duplicates
 
 # Result in console:
 # False    99441
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Customers.apply(lambda col: col.duplicated().sum()))
+print(Customers_profile.duplicated)
 
 # Result in console:
 # customer_id                     0
@@ -181,7 +156,7 @@ print(Customers.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Customers.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Customers_profile.pct(Customers_profile.duplicated))
 
 # Result in console:
 # customer_id                  0.000
@@ -192,7 +167,7 @@ print(round(Customers.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Customers.apply(lambda col: col.nunique()))
+print(Customers_profile.unique)
 
 # Result in console:
 # customer_id                 99441
@@ -203,7 +178,7 @@ print(Customers.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Customers.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Customers_profile.pct(Customers_profile.unique))
 
 # Result in console:
 # customer_id                 100.000
@@ -217,7 +192,7 @@ print(round(Customers.apply(lambda col: col.nunique()/len(col))*100,3))
 
 # Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Customers,"Customers")
+plot_total_missing_unique_values(Customers_profile)
 
 # ii.GEOLOCATION
 
@@ -238,8 +213,12 @@ Geolocation.info()
 # dtypes: float64(2), int64(1), object(2)
 # memory usage: 38.2+ MB
 
+## Profiling Geolocation in a single pass; the 1M-row table uses HyperLogLog distinct counts,
+## so unique and duplicate counts below are estimates (pass approximate=False for exact ones)
+Geolocation_profile = profile_table(Geolocation, "Geolocation", approximate=True)
+
 ## Checking Missing values
-Geolocation.isnull().sum()
+Geolocation_profile.missing
 
 # Result in console:
 # geolocation_zip_code_prefix    0
@@ -250,7 +229,7 @@ Geolocation.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Geolocation.isnull().sum()/len(Geolocation) * 100,3)
+Geolocation_profile.pct(Geolocation_profile.missing)
 
 # Result in console:
 # geolocation_zip_code_prefix    0.0
@@ -261,7 +240,7 @@ round(Geolocation.isnull().sum()/len(Geolocation) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Geolocation.duplicated().value_counts()
+Geolocation_profile.row_duplicates
 
 # Result in console:
 # False    738332
@@ -269,7 +248,7 @@ Geolocation.duplicated().value_counts()
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Geolocation.apply(lambda col: col.duplicated().sum()))
+print(Geolocation_profile.duplicated)
 
 # Result in console:
 # geolocation_zip_code_prefix     981148
@@ -280,7 +259,7 @@ print(Geolocation.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Geolocation.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Geolocation_profile.pct(Geolocation_profile.duplicated))
 
 # Result in console:
 # geolocation_zip_code_prefix    98.099
@@ -291,7 +270,7 @@ print(round(Geolocation.apply(lambda col: col.duplicated().sum()/len(col))*100,3
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Geolocation.apply(lambda col: col.nunique()))
+print(Geolocation_profile.unique)
 
 # Result in console:
 # geolocation_zip_code_prefix     19015
@@ -302,7 +281,7 @@ print(Geolocation.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Geolocation.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Geolocation_profile.pct(Geolocation_profile.unique))
 
 # Result in console:
 # geolocation_zip_code_prefix     1.901
@@ -314,7 +293,7 @@ print(round(Geolocation.apply(lambda col: col.nunique()/len(col))*100,3))
 
 ## Visualizations
 
-plot_total_missing_unique_values(Geolocation,"Geolocation")
+plot_total_missing_unique_values(Geolocation_profile)
 
 
 # iii.ORDER_ITEMS
@@ -339,7 +318,7 @@ Order_items.info()
 # memory usage: 6.0+ MB
 
 ## Change formats to datetime
-Order_items['shipping_limit_date']=pd.to_datetime(Order_items['shipping_limit_date'], errors='coerce')
+# shipping_limit_date is already parsed by load_table
 
 ## Checking Order_Items database after change of format
 Order_items.info()
@@ -362,8 +341,11 @@ Order_items.info()
 # dtypes: datetime64[ns](1), float64(4), int64(1), object(3)
 # memory usage: 7.7+ MB
 
+## Profiling Order_items in a single pass: missing, duplicated and unique values from one factorization per column
+Order_items_profile = profile_table(Order_items, "Order_items")
+
 ## Checking Missing values
-Order_items.isnull().sum()
+Order_items_profile.missing
 
 # Result in console:
 # order_id               0
@@ -376,7 +358,7 @@ Order_items.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Order_items.isnull().sum()/len(Order_items) * 100,2)
+Order_items_profile.pct(Order_items_profile.missing, 2)
 
 # Result in console:
 # order_id               0.0
@@ -389,14 +371,14 @@ round(Order_items.isnull().sum()/len(Order_items) * 100,2)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Order_items.duplicated().value_counts()
+Order_items_profile.row_duplicates
 
 # Result in console:
 # False    112650
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Order_items.apply(lambda col: col.duplicated().sum()))
+print(Order_items_profile.duplicated)
 
 # Result in console:
 # order_id                13984
@@ -409,7 +391,7 @@ print(Order_items.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Order_items.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Order_items_profile.pct(Order_items_profile.duplicated))
 
 # Result in console:
 # order_id               12.414
@@ -422,7 +404,7 @@ print(round(Order_items.apply(lambda col: col.duplicated().sum()/len(col))*100,3
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Order_items.apply(lambda col: col.nunique()))
+print(Order_items_profile.unique)
 
 # Result in console:
 # order_id               98666
@@ -435,7 +417,7 @@ print(Order_items.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Order_items.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Order_items_profile.pct(Order_items_profile.unique))
 
 # Result in console:
 # order_id               87.586
@@ -451,7 +433,7 @@ print(round(Order_items.apply(lambda col: col.nunique()/len(col))*100,3))
 
 # Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Order_items,"Order_items")
+plot_total_missing_unique_values(Order_items_profile)
 
 # iv.ORDER_PAYMENTS
 
@@ -472,8 +454,11 @@ Order_Payments.info()
 # dtypes: float64(1), int64(2), object(2)
 # memory usage: 4.0+ MB
 
+## Profiling Order_Payments in a single pass: missing, duplicated and unique values from one factorization per column
+Order_Payments_profile = profile_table(Order_Payments, "Order_Payments")
+
 ## Checking Missing values
-Order_Payments.isnull().sum()
+Order_Payments_profile.missing
 
 # Result in console:
 # order_id                0
@@ -484,7 +469,7 @@ Order_Payments.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Order_Payments.isnull().sum()/len(Order_Payments) * 100,3)
+Order_Payments_profile.pct(Order_Payments_profile.missing)
 
 # Result in console:
 # order_id                0.0
@@ -495,14 +480,14 @@ round(Order_Payments.isnull().sum()/len(Order_Payments) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Order_Payments.duplicated().value_counts()
+Order_Payments_profile.row_duplicates
 
 # Result in console:
 # False    103886
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Order_Payments.apply(lambda col: col.duplicated().sum()))
+print(Order_Payments_profile.duplicated)
 
 # Result in console:
 # order_id                  4446
@@ -513,7 +498,7 @@ print(Order_Payments.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Order_Payments.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Order_Payments_profile.pct(Order_Payments_profile.duplicated))
 
 # Result in console:
 # order_id                 4.280
@@ -524,7 +509,7 @@ print(round(Order_Payments.apply(lambda col: col.duplicated().sum()/len(col))*10
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Order_Payments.apply(lambda col: col.nunique()))
+print(Order_Payments_profile.unique)
 
 # Result in console:
 # order_id                99440
@@ -535,7 +520,7 @@ print(Order_Payments.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Order_Payments.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Order_Payments_profile.pct(Order_Payments_profile.unique))
 
 # Result in console:
 # order_id                95.720
@@ -549,7 +534,7 @@ print(round(Order_Payments.apply(lambda col: col.nunique()/len(col))*100,3))
 
 # Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Order_Payments,"Order_Payments")
+plot_total_missing_unique_values(Order_Payments_profile)
 
 # v.ORDER_REVIEWS
 
@@ -573,8 +558,7 @@ Order_Reviews.info()
 # memory usage: 4.8+ MB
 
 ## Change formats to datetime
-Order_Reviews['review_creation_date']=pd.to_datetime(Order_Reviews['review_creation_date'], errors='coerce')
-Order_Reviews['review_answer_timestamp']=pd.to_datetime(Order_Reviews['review_answer_timestamp'], errors='coerce')
+# review_creation_date and review_answer_timestamp are already parsed by load_table
 
 ## Checking Order_Reviews database after changes
 Order_Reviews.info()
@@ -595,8 +579,11 @@ Order_Reviews.info()
 # dtypes: datetime64[ns](2), int64(1), object(4)
 # memory usage: 4.8+ MB
 
+## Profiling Order_Reviews in a single pass: missing, duplicated and unique values from one factorization per column
+Order_Reviews_profile = profile_table(Order_Reviews, "Order_Reviews")
+
 ## Checking Missing values
-Order_Reviews.isnull().sum()
+Order_Reviews_profile.missing
 
 # Result in console:
 # review_id                      0
@@ -609,7 +596,7 @@ Order_Reviews.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Order_Reviews.isnull().sum()/len(Order_Reviews) * 100,3)
+Order_Reviews_profile.pct(Order_Reviews_profile.missing)
 
 # Result in console:
 # review_id                   0.000
@@ -622,14 +609,14 @@ round(Order_Reviews.isnull().sum()/len(Order_Reviews) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Order_Reviews.duplicated().value_counts()
+Order_Reviews_profile.row_duplicates
 
 # Result in console:
 # False    89999
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Order_Reviews.apply(lambda col: col.duplicated().sum()))
+print(Order_Reviews_profile.duplicated)
 
 # Result in console:
 # review_id                    677
@@ -642,7 +629,7 @@ print(Order_Reviews.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Order_Reviews.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Order_Reviews_profile.pct(Order_Reviews_profile.duplicated))
 
 # Result in console:
 # review_id                   0.752
@@ -655,7 +642,7 @@ print(round(Order_Reviews.apply(lambda col: col.duplicated().sum()/len(col))*100
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Order_Reviews.apply(lambda col: col.nunique()))
+print(Order_Reviews_profile.unique)
 
 # Result in console:
 # review_id                  89322
@@ -668,7 +655,7 @@ print(Order_Reviews.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Order_Reviews.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Order_Reviews_profile.pct(Order_Reviews_profile.unique))
 
 # Result in console:
 # review_id                  99.248
@@ -684,7 +671,7 @@ print(round(Order_Reviews.apply(lambda col: col.nunique()/len(col))*100,3))
 
 ## Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Order_Reviews,"Order_Reviews")
+plot_total_missing_unique_values(Order_Reviews_profile)
 
 
 # vi. ORDER_STATUS
@@ -710,11 +697,7 @@ Order_Status.info()
 # memory usage: 6.1+ MB
 
 ## Change formats to datetime
-Order_Status['order_purchase_timestamp']=pd.to_datetime(Order_Status['order_purchase_timestamp'], errors='coerce')
-Order_Status['order_approved_at']=pd.to_datetime(Order_Status['order_approved_at'], errors='coerce')
-Order_Status['order_delivered_carrier_date']=pd.to_datetime(Order_Status['order_delivered_carrier_date'], errors='coerce')
-Order_Status['order_delivered_customer_date']=pd.to_datetime(Order_Status['order_delivered_customer_date'], errors='coerce')
-Order_Status['order_estimated_delivery_date']=pd.to_datetime(Order_Status['order_estimated_delivery_date'], errors='coerce')
+# The five order timestamps are already parsed by load_table
 
 ## Checking Order_Status database after changes
 Order_Status.info()
@@ -736,8 +719,11 @@ Order_Status.info()
 # dtypes: datetime64[ns](5), object(3)
 # memory usage: 6.1+ MB
 
+## Profiling Order_Status in a single pass: missing, duplicated and unique values from one factorization per column
+Order_Status_profile = profile_table(Order_Status, "Order_Status")
+
 ## Checking Missing values
-Order_Status.isnull().sum()
+Order_Status_profile.missing
 
 # Result in console:
 # order_id                            0
@@ -751,7 +737,7 @@ Order_Status.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Order_Status.isnull().sum()/len(Order_Status) * 100,3)
+Order_Status_profile.pct(Order_Status_profile.missing)
 
 # Result in console:
 # order_id                         0.000
@@ -765,14 +751,14 @@ round(Order_Status.isnull().sum()/len(Order_Status) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Order_Status.duplicated().value_counts()
+Order_Status_profile.row_duplicates
 
 # Result in console:
 # False    99441
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Order_Status.apply(lambda col: col.duplicated().sum()))
+print(Order_Status_profile.duplicated)
 
 # Result in console:
 # order_id                             0
@@ -787,7 +773,7 @@ print(Order_Status.apply(lambda col: col.duplicated().sum()))
 
 
 ## Checking %Duplicates in each column
-print(round(Order_Status.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Order_Status_profile.pct(Order_Status_profile.duplicated))
 
 # Result in console:
 # order_id                          0.000
@@ -801,7 +787,7 @@ print(round(Order_Status.apply(lambda col: col.duplicated().sum()/len(col))*100,
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Order_Status.apply(lambda col: col.nunique()))
+print(Order_Status_profile.unique)
 
 # Result in console:
 # order_id                         99441
@@ -815,7 +801,7 @@ print(Order_Status.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Order_Status.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Order_Status_profile.pct(Order_Status_profile.unique))
 
 # Result in console:
 # order_id                         100.000
@@ -832,7 +818,7 @@ print(round(Order_Status.apply(lambda col: col.nunique()/len(col))*100,3))
 
 ## Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Order_Status,"Order_Status")
+plot_total_missing_unique_values(Order_Status_profile)
 
 # vii. PRODUCTS
 
@@ -857,8 +843,11 @@ Products.info()
 # dtypes: float64(7), object(2)
 # memory usage: 2.3+ MB
 
+## Profiling Products in a single pass: missing, duplicated and unique values from one factorization per column
+Products_profile = profile_table(Products, "Products")
+
 ## Checking Missing values
-Products.isnull().sum()
+Products_profile.missing
 
 # Result in console:
 # product_id                      0
@@ -873,7 +862,7 @@ Products.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Products.isnull().sum()/len(Products) * 100,3)
+Products_profile.pct(Products_profile.missing)
 
 # Result in console:
 # product_id                    0.000
@@ -888,14 +877,14 @@ round(Products.isnull().sum()/len(Products) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Products.duplicated().value_counts()
+Products_profile.row_duplicates
 
 # Result in console:
 # False    32951
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Products.apply(lambda col: col.duplicated().sum()))
+print(Products_profile.duplicated)
 
 # Result in console:
 # product_id                        0
@@ -914,7 +903,7 @@ print(Products.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Products.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Products_profile.pct(Products_profile.duplicated))
 
 # Result in console:
 # product_id                     0.000
@@ -929,7 +918,7 @@ print(round(Products.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Products.apply(lambda col: col.nunique()))
+print(Products_profile.unique)
 
 # Result in console:
 # product_id                    32951
@@ -944,7 +933,7 @@ print(Products.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Products.apply(lambda col: col.nunique()/len(col))*100,2))
+print(Products_profile.pct(Products_profile.unique, 2))
 
 # Result in console:
 # product_id                    32951
@@ -962,7 +951,7 @@ print(round(Products.apply(lambda col: col.nunique()/len(col))*100,2))
 
 # Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Products,"Products")
+plot_total_missing_unique_values(Products_profile)
 
 # viii.SELLERS
 
@@ -982,8 +971,11 @@ Sellers.info()
 # dtypes: int64(1), object(3)
 # memory usage: 96.8+ KB
 
+## Profiling Sellers in a single pass: missing, duplicated and unique values from one factorization per column
+Sellers_profile = profile_table(Sellers, "Sellers")
+
 ## Checking Missing values
-Sellers.isnull().sum()
+Sellers_profile.missing
 
 # Result in console:
 # seller_id                 0
@@ -993,7 +985,7 @@ Sellers.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Sellers.isnull().sum()/len(Sellers) * 100,3)
+Sellers_profile.pct(Sellers_profile.missing)
 
 # Result in console:
 # seller_id                 0.0
@@ -1006,14 +998,14 @@ round(Sellers.isnull().sum()/len(Sellers) * 100,3)
 # There are no missing values
 
 ## Checking Duplicates in all rows
-Sellers.duplicated().value_counts()
+Sellers_profile.row_duplicates
 
 # Result in console:
 # False    3095
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Sellers.apply(lambda col: col.duplicated().sum()))
+print(Sellers_profile.duplicated)
 
 # Result in console:
 # seller_id                        0
@@ -1023,7 +1015,7 @@ print(Sellers.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking number of Unique Values in each column
-print(Sellers.apply(lambda col: col.nunique()))
+print(Sellers_profile.unique)
 
 # Result in console:
 # seller_id                 3095
@@ -1033,7 +1025,7 @@ print(Sellers.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Sellers.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Sellers_profile.pct(Sellers_profile.unique))
 
 # Result in console:
 # seller_id                 100.000
@@ -1046,121 +1038,47 @@ print(round(Sellers.apply(lambda col: col.nunique()/len(col))*100,3))
 
 # Visualization of total rows, missing values and unique values per column
 
-plot_total_missing_unique_values(Sellers,"Sellers")
+plot_total_missing_unique_values(Sellers_profile)
+
+# Rendering the profiles of all tables into one multi-page PDF without interactive matplotlib
+render_profiles([Customers_profile, Geolocation_profile, Order_items_profile, Order_Payments_profile,
+                 Order_Reviews_profile, Order_Status_profile, Products_profile, Sellers_profile],
+                "data_quality_report.pdf")
 
 # PRODUCT CATEGORY
 
 # II. MERGING DATA
-
-#  Consolidation of databases to connect databases
-
-# Consolidating Order_Payments to have 1 row per order_id
-Order_Payments2 = Order_Payments.groupby(
-    ["order_id"]
-).agg(
-    payment_sequential=("payment_sequential", "count"),
-    payment_installments=("payment_installments", "mean"),
-    payment_value=("payment_value", "sum"),
-    payment_type_count=("payment_type", "nunique")
-).reset_index()
-
-# Consolidating Order_Reviews keeping the latest value for each order_id based on review_creation_date
-Order_Reviews2 = Order_Reviews.loc[
-    Order_Reviews.groupby('order_id')['review_creation_date'].idxmax()
-]
-
-# Creating a first database from Order_items -- 112650
-database1= Order_items
-
-# Connecting database1 to Products -- 112650
-database1=database1.merge(Products, how='left', left_on='product_id', right_on='product_id')
-
-# Connecting database1 to Sellers -- 112650
-database1=database1.merge(Sellers, how='left', left_on='seller_id', right_on='seller_id')
-
-# Connecting database1 to Order_Status -- 112650
-database1=database1.merge(Order_Status, how='left', left_on='order_id', right_on='order_id')
-
-# Connecting Order_Payments2 to database1 -- 112650
-database1=database1.merge(Order_Payments2, how='left', left_on='order_id', right_on='order_id')
-
-# Connecting database1 to Order_Reviews2 -- 112650
-database1=database1.merge(Order_Reviews2, how='left', left_on='order_id', right_on='order_id')
-
-# Connecting database1 to Customers
-database1=database1.merge(Customers, how='left', left_on='customer_id', right_on='customer_id')
-
 # III. CREATING NEW FEATURES FOR MODELLING
 
 # Loading database Product_Categories
-Product_Categories=pd.read_csv("refined_product_categories.csv")
-
-# Connecting database1 to Product_Categories
-Final_database=database1.merge(Product_Categories, how='left', left_on='product_category_name', right_on='product_category_name')
-
-# Total_purchase_count as the total number of purchases of the customer
-Final_database['total_purchase_count'] = Final_database.groupby('customer_unique_id')['order_id'].transform('count')
-
-# Product payment value as the sum of price and freight value
-Final_database['product_payment_value']=Final_database['price']+Final_database['freight_value']
-
-# Freight_to_price_ratio as the ratio of Freight over Price
-Final_database['freight_to_price_ratio'] = Final_database['freight_value'] / Final_database['price']
-
-# Days from Creation of the review to Answer
-Final_database['diff_review_creation_answer_days']=(
-    Final_database['review_answer_timestamp']-Final_database['review_creation_date']
-    ).dt.days
-
-# Days from Purchase to Approved
-Final_database['diff_approved_purchased'] = (
-    Final_database['order_approved_at'] - Final_database['order_purchase_timestamp']
-    ).dt.days
-
-# Days from Estimated Delivery to Customer Delivered
-Final_database['diff_customerdelivered_estimated'] = (
-    Final_database['order_delivered_customer_date'] - Final_database['order_estimated_delivery_date']
-    ).dt.days
-
-# Days from Carrier to Customer
-Final_database['diff_customerdelivered_deliveredcarrier'] = (
-    Final_database['order_delivered_customer_date'] - Final_database['order_delivered_carrier_date']
-    ).dt.days
-
-# Days from Purchase to Customer Delivered
-Final_database['diff_customerdelivered_purchase'] = (
-    Final_database['order_delivered_customer_date'] - Final_database['order_purchase_timestamp']
-    ).dt.days
-
-# Days from Purchase to Delivered Carrier
-Final_database['diff_deliveredcarrier_purchase'] = (
-    Final_database['order_delivered_carrier_date'] - Final_database['order_purchase_timestamp']
-    ).dt.days
-
-# Working days from Purchased to Approved
-Final_database['diff_approved_purchased_wd'] = Final_database.apply(
-    lambda row: calculate_working_days(row['order_purchase_timestamp'], row['order_approved_at']),
-    axis=1
-)
-
-# Working days from Carrier to Customer Delivered
-Final_database['diff_customerdelivered_deliveredcarrier_wd'] = Final_database.apply(
-    lambda row: calculate_working_days(row['order_delivered_carrier_date'], row['order_delivered_customer_date']),
-    axis=1
-)
-
-# Working days from Purchase to Delivered Carrier
-Final_database['diff_deliveredcarrier_purchase_wd'] = Final_database.apply(
-    lambda row: calculate_working_days(row['order_purchase_timestamp'], row['order_delivered_carrier_date']),
-    axis=1
-)
-
-# Creating index Order_id + Product_id
-Final_database['order_id_product_id'] = Final_database['order_id'] +'-'+ Final_database['product_id'] 
+Product_Categories=load_table("Product_Categories")
+
+# The consolidation, merging and feature steps are in features.build_final_database.
+# Its output is kept in an on-disk feature store (partitioned by purchase month, keyed by order_id_product_id);
+# each run only rebuilds the orders whose source rows changed: new orders, status changes, new reviews...
+# Zip prefix centroids (missing prefixes filled from the closest known one) and a BallTree of the seller
+# locations, built once here and saved so that scoring processes can load them instead of rebuilding
+# (SpatialIndex.load memory-maps the tree)
+centroids = fill_missing_prefixes(zip_centroids(Geolocation))
+centroids.save("zip_centroids.npz")
+sellers_index = seller_index(Sellers, centroids)
+sellers_index.save("seller_index.joblib")
+
+# Geolocation reaches the store through the centroids only, which are fingerprinted as a lookup
+feature_store = FeatureStore("feature_store",
+                             build=partial(build_final_database, centroids=centroids, sellers=sellers_index),
+                             lookups={'zip_centroids': centroids})
+feature_store.update({
+    'Order_items': Order_items, 'Order_Status': Order_Status, 'Order_Payments': Order_Payments,
+    'Order_Reviews': Order_Reviews, 'Products': Products, 'Sellers': Sellers, 'Customers': Customers,
+    'Product_Categories': Product_Categories,
+})
+Final_database = feature_store.load()
 
 # iv. FINAL EDA
 
 # Checking Final_database
+# (the console output below predates prune_columns, which no longer joins the unused columns)
 Final_database.info()
 
 # Result in console:
@@ -1226,8 +1144,11 @@ Final_database.info()
 # dtypes: datetime64[ns](8), float64(25), int64(4), object(17)
 # memory usage: 46.4+ MB
 
+## Profiling Final_database in a single pass: missing, duplicated and unique values from one factorization per column
+Final_database_profile = profile_table(Final_database, "Final_database")
+
 ## Checking Missing values
-Final_database.isnull().sum()
+Final_database_profile.missing
 
 # Result in console:
 # order_id                                           0
@@ -1287,7 +1208,7 @@ Final_database.isnull().sum()
 # dtype: int64
 
 ## Checking %Missing values
-round(Final_database.isnull().sum()/len(Final_database) * 100,3)
+Final_database_profile.pct(Final_database_profile.missing)
 
 # Result in console:
 # order_id                                       0.000
@@ -1347,14 +1268,14 @@ round(Final_database.isnull().sum()/len(Final_database) * 100,3)
 # dtype: float64
 
 ## Checking Duplicates in all rows
-Final_database.duplicated().value_counts()
+Final_database_profile.row_duplicates
 
 # Result in console:
 # False    112650
 # Name: count, dtype: int64
 
 ## Checking Duplicates in each column
-print(Final_database.apply(lambda col: col.duplicated().sum()))
+print(Final_database_profile.duplicated)
 
 # Result in console:
 # order_id                                       13984
@@ -1414,7 +1335,7 @@ print(Final_database.apply(lambda col: col.duplicated().sum()))
 # dtype: int64
 
 ## Checking %Duplicates in each column
-print(round(Final_database.apply(lambda col: col.duplicated().sum()/len(col))*100,3))
+print(Final_database_profile.pct(Final_database_profile.duplicated))
 
 # Result in console:
 # order_id                                      12.414
@@ -1474,7 +1395,7 @@ print(round(Final_database.apply(lambda col: col.duplicated().sum()/len(col))*10
 # dtype: float64
 
 ## Checking number of Unique Values in each column
-print(Final_database.apply(lambda col: col.nunique()))
+print(Final_database_profile.unique)
 
 # Result in console:
 # order_id                                       98666
@@ -1534,7 +1455,7 @@ print(Final_database.apply(lambda col: col.nunique()))
 # dtype: int64
 
 ## Checking % of Unique Values in each column
-print(round(Final_database.apply(lambda col: col.nunique()/len(col))*100,3))
+print(Final_database_profile.pct(Final_database_profile.unique))
 
 # Result in console:
 # order_id                                      87.586
@@ -1776,8 +1697,13 @@ Final_database.info()
 # dtypes: float64(18), int64(1), object(4)
 # memory usage: 19.9+ MB
 
-# Exporting Final_database
-Final_database.to_excel("Final_database.xlsx", index=False)
+# Exporting Final_database in the background while the models train:
+# Parquet for downstream steps and a streaming (constant-memory) spreadsheet for business users, which shows
+# the original Olist IDs rather than their codes
+Final_database_exports = [
+    export_table(Final_database, "Final_database.parquet"),
+    export_table(ids.decode_table(Final_database), "Final_database.xlsx"),
+]
 
 # List of numerical columns to normalise
 columns_to_normalise = [
@@ -1786,32 +1712,31 @@ columns_to_normalise = [
     "diff_customerdelivered_deliveredcarrier", "diff_customerdelivered_purchase",
     "diff_deliveredcarrier_purchase", "diff_approved_purchased_wd",
     "diff_customerdelivered_deliveredcarrier_wd", "diff_deliveredcarrier_purchase_wd",
-    "price", "payment_type_count", "product_payment_value",
+    "payment_type_count", "product_payment_value",
     "diff_review_creation_answer_days",
-    "product_name_lenght","total_purchase_count"
+    "product_name_lenght","total_purchase_count", "customer_seller_distance_km", "sellers_within_50km"
     ]
 
-# Initialise the scaler
-scaler = StandardScaler()
+# Building the model matrix in one pass without modifying Final_database:
+#   normalise the numerical columns, one-hot encode Category, customer_state and seller_state,
+#   binarise review_score (1 if > 3) and index the rows by order_id_product_id
+# The dummies are uint8, or with USE_SPARSE_MATRIX=1 the whole matrix is a float32 CSR matrix (smaller only when
+# the one-hot groups average more than 8 categories, and not usable with GBDT_ENGINE='hist'); the category
+# vocabulary is kept in model_vocabulary.json so the dummy columns stay the same from one retrain to the next
+USE_SPARSE_MATRIX = os.environ.get("USE_SPARSE_MATRIX", "0") == "1"
+vocabulary = load_vocabulary("model_vocabulary.json") if os.path.exists("model_vocabulary.json") else None
+preprocessor = ModelMatrixTransformer(
+    numeric=columns_to_normalise,
+    categorical={"Category": "type_", "customer_state": "cs_type_", "seller_state": "ss_type_"},
+    label="review_score", label_threshold=3, index="order_id_product_id",
+    dummy_dtype="uint8", sparse=USE_SPARSE_MATRIX, vocabulary=vocabulary)
 
-# Normalise only the selected numerical columns
-Final_database_norm=Final_database
-Final_database_norm[columns_to_normalise] = scaler.fit_transform(Final_database[columns_to_normalise])
-
-
-Final_database_norm = pd.get_dummies(Final_database_norm, columns=["Category"], prefix=["type_"], dtype='int')
-Final_database_norm = pd.get_dummies(Final_database_norm, columns=["customer_state"], prefix=["cs_type_"], dtype='int')
-Final_database_norm = pd.get_dummies(Final_database_norm, columns=["seller_state"], prefix=["ss_type_"], dtype='int')
-
-# Normalise review_score
-Final_database_norm['review_score'] = Final_database_norm['review_score'].apply(lambda x: 1 if x > 3 else 0)
-
-# Setting index
-Final_database_norm = Final_database_norm.set_index('order_id_product_id')
-
-# Exporting Final_database_norm
-#Final_database_norm.to_excel("Final_database_norm.xlsx", index=False)
+# Seperating x and y
+xvalues, yvalue = preprocessor.fit_transform(Final_database)
+preprocessor.save_vocabulary("model_vocabulary.json")
 
+# Peak memory used to build the matrix
+print(preprocessor.memory_report_)
 
 ## V. MODELLING
 
@@ -1820,25 +1745,23 @@ from sklearn.model_selection import train_test_split
 
 # RESET THE DATA TO REMOVE THE EFFECT OF UNDERSAMPLING
 
-# Seperating x and y
-xvalues=Final_database_norm.drop(["review_score"],axis=1)
-yvalue=Final_database_norm["review_score"]
-
 # Splitting data into training and test
 x_train, x_test, y_train, y_test = train_test_split(xvalues, yvalue, test_size = 0.3, random_state=4567, stratify=yvalue)
      
 
-from imblearn.over_sampling import SMOTE
-
 # Creating an SMOTE instance that will return 2x as many majority as minority class
 # I.e. sampling_strategy=0.5 means minority class will be 50% of the majority class
-smote = SMOTE(random_state=42, sampling_strategy=0.5)
+# It works on float32 values, and the Category/state dummies are voted from the neighbours (as SMOTENC)
+# instead of being interpolated into fractions
+smote = FastSMOTE(sampling_strategy=0.5, categorical_groups=preprocessor.dummy_groups_, random_state=42)
 
-# Note we only undersample the training data not the test data
-x_train, y_train = smote.fit_resample(x_train, y_train)
+# Note we only oversample the training data not the test data
+# The tuning below oversamples the training part of each CV fold, so its scores are on real rows only;
+# x_train_resampled is used to fit the final models
+x_train_resampled, y_train_resampled = smote.fit_resample(x_train, y_train)
 
 # Getting the value countes by temporarily converting to a dataframe
-pd.Series(y_train).value_counts()
+pd.Series(y_train_resampled).value_counts()
 
 import pandas as pd
 import numpy as np
@@ -1860,9 +1783,9 @@ import warnings
 warnings.filterwarnings("ignore")
 
 # Printing the shapes to check everything is OK
-print(x_train.shape)
+print(x_train_resampled.shape)
 print(x_test.shape)
-print(y_train.shape)
+print(y_train_resampled.shape)
 print(y_test.shape)
 # All splits check out and look perfect.
 
@@ -1875,30 +1798,57 @@ XGB_algo = XGB()
 
 # Trying Bayesian optimisation
 
+# Trials run in parallel worker processes (TRIAL_JOBS at once); parallel_fmin is a local stand-in for
+# SparkTrials/MongoTrials. Each trial scores its 5 CV folds one after the other so that it can be pruned:
+# after every fold it is compared with the fold scores of the finished trials (median rule) and abandoned
+# if it is already below the median, so all the cores go to running trials. The first round runs only the
+# pruner's startup trials and later rounds grow with the number of finished trials, so that the pruner has a
+# history to compare with even when there are more cores than evaluations.
+TRIAL_JOBS, CV_JOBS = split_cores(cv=1)
+pruner = MedianPruner(n_startup_trials=5, min_folds=1)
+
+# The 5 CV folds are split once and shared by every trial of the three models (float32 arrays, plus one
+# prebuilt QuantileDMatrix per fold for XGBoost); SMOTE is applied to the training part of each fold
+tuning_folds = FoldCache(x_train, y_train, cv=5, resampler=smote)
+
+# Every finished trial is saved in tuning_trials.sqlite: an interrupted run on the same training data picks
+# up where it stopped, and a retrain on new data starts its searches from the trials of the earlier runs
+trial_store = TrialStore("tuning_trials.sqlite", run=data_digest(x_train, y_train))
+
+# Training backend of the final GBDT: 'exact' (GradientBoostingClassifier) or 'hist'
+# (HistGradientBoostingClassifier, multi-threaded); RF and XGB are trained on all cores
+GBDT_ENGINE = os.environ.get("GBDT_ENGINE", "exact")
+# The 'hist' engine needs the dense model matrix (USE_SPARSE_MATRIX=0)
+check_engine(GBDT_ENGINE, x_train)
+
 ##RF
 from hyperopt import fmin, tpe, hp, Trials
 from sklearn.model_selection import cross_val_score
-def objective(params):
+def objective(params, history):
     # must be integer
     params['n_estimators'] = int(params['n_estimators'])
     params['max_depth'] = int(params['max_depth'])
     params['min_samples_split'] = int(params['min_samples_split'])
-    clf = RF(**params, random_state=1234)
-    scores = cross_val_score(clf, x_train, y_train, cv=5, scoring='precision_macro')
-    return -np.mean(scores)
+    clf = RF(**params, random_state=1234, n_jobs=CV_JOBS)
+    return cross_val_result(clf, tuning_folds, scoring='precision_macro', history=history, pruner=pruner)
 space = {
     'n_estimators': hp.quniform('n_estimators', 50, 600, 1),  
     'max_depth': hp.quniform('max_depth', 2, 7, 1),
     'min_samples_split': hp.quniform('min_samples_split', 2, 10, 1), 
     'max_features': hp.choice('max_features', ['sqrt', 'log2', None])}
-trials=Trials()
-best_params = fmin(
+trials, max_evals = trial_store.load('RF', space, max_evals=15)
+best_params = parallel_fmin(
     fn=objective,                # optimize objective
     space=space,                 # search the space
     algo=tpe.suggest,            #use tpe algo
-    max_evals=15,                # maximum evaluation time
+    max_evals=max_evals,         # 15 new evaluations on top of the earlier runs
     trials=trials,               # record trials
-    rstate=np.random.default_rng(1234)
+    rstate=np.random.default_rng(1234),
+    n_jobs=TRIAL_JOBS,           # trials evaluated at once
+    pass_history=True,           # fold scores of finished trials, for pruning
+    startup_trials=pruner.n_startup_trials,  # rounds sized so that the pruner has a history
+    run=trial_store.run,         # earlier runs' trials only seed TPE
+    checkpoint=trial_store.checkpoint('RF', space)
 )
 print("Best Parameters:", best_params)
 
@@ -1907,100 +1857,133 @@ best_params['n_estimators'] = int(best_params['n_estimators'])
 best_params['max_depth'] = int(best_params['max_depth'])
 best_params['min_samples_split'] = int(best_params['min_samples_split'])
 best_params['max_features'] = ['sqrt', 'log2', None][best_params['max_features']]
-RF_algo = RF(**best_params, random_state=1234)
-RF_model=RF_algo.fit(x_train, y_train)
+RF_algo = make_model('RF', best_params, n_jobs=-1, random_state=1234)
+RF_model=RF_algo.fit(x_train_resampled, y_train_resampled)
 
 ##GBDT
-def objective(params2):
+def objective(params2, history):
     params2['n_estimators'] = int(params2['n_estimators'])
     params2['max_depth'] = int(params2['max_depth'])
+    # n_estimators is an upper bound: training stops after 20 stages without improvement on the real rows
+    # held out of the fold for early stopping (the same 10% as XGB, no synthetic rows)
     clf = GBDT(**params2, random_state=1234)
-    scores = cross_val_score(clf, x_train, y_train, cv=5, scoring='precision_macro') 
-    return -np.mean(scores)
+    return cross_val_result(clf, tuning_folds, scoring='precision_macro', history=history, pruner=pruner,
+                            early_stopping_rounds=20)
 space2 = {
     'n_estimators': hp.quniform('n_estimators', 50, 600, 1), 
     'learning_rate': hp.uniform('learning_rate', 0.01, 0.21),
     'criterion': hp.choice('criterion', ['friedman_mse', 'squared_error']),
     'max_depth': hp.quniform('max_depth', 3, 10, 1)}
-trials2 = Trials()
-best_params2 = fmin(
+trials2, max_evals2 = trial_store.load('GBDT', space2, max_evals=10)
+best_params2 = parallel_fmin(
     fn=objective,                
     space=space2,                 
     algo=tpe.suggest,            
-    max_evals=10,                
+    max_evals=max_evals2,                
     trials=trials2,               
-    rstate=np.random.default_rng(1234))
+    rstate=np.random.default_rng(1234),
+    n_jobs=TRIAL_JOBS,
+    pass_history=True,
+    startup_trials=pruner.n_startup_trials,
+    run=trial_store.run,
+    checkpoint=trial_store.checkpoint('GBDT', space2))
 print("Best Parameters:", best_params2)
 best_params2['n_estimators'] = int(best_params2['n_estimators'])
 best_params2['max_depth'] = int(best_params2['max_depth'])
 best_params2['criterion'] = ['friedman_mse', 'squared_error'][best_params2['criterion']]
-GBDT_algo = GBDT(**best_params2, random_state=1234) 
-GBDT_model=GBDT_algo.fit(x_train, y_train)
+# The trials were scored with early stopping, so the final model keeps the number of trees the best trial used
+# (trials saved before this was recorded keep the searched upper bound)
+best_result2 = best_trial(trials2, trial_store.run)['result']
+best_params2['n_estimators'] = best_result2.get('best_n_estimators', best_params2['n_estimators'])
+GBDT_algo = make_model('GBDT', best_params2, engine=GBDT_ENGINE, random_state=1234)
+GBDT_model=GBDT_algo.fit(x_train_resampled, y_train_resampled)
 
 
 ##XGB
-def objective(params3):
+def objective(params3, history):
     params3['n_estimators'] = int(params3['n_estimators'])
     params3['max_depth'] = int(params3['max_depth'])
-    clf = XGB(**params3, use_label_encoder=False, random_state=1234)
-    scores = cross_val_score(clf, x_train, y_train, cv=5, scoring='precision_macro')
-    return -np.mean(scores)
+    # n_estimators is an upper bound: boosting stops after 20 rounds without improvement on 10% of the fold
+    # Trained with the native API on the cached DMatrix of each fold (precision_macro)
+    return xgb_cross_val_result({**params3, 'random_state': 1234, 'n_jobs': CV_JOBS}, tuning_folds,
+                                early_stopping_rounds=20, history=history, pruner=pruner)
 space3 = {
     'n_estimators': hp.quniform('n_estimators', 50, 600, 1),
     'eta': hp.uniform('eta', 0.01, 5.0),                      
     'objective': hp.choice('objective', ['binary:logistic', 'binary:hinge']),  
     'max_depth': hp.quniform('max_depth', 3, 10, 1)}
-trials3 = Trials()
-best_params3 = fmin(
+trials3, max_evals3 = trial_store.load('XGB', space3, max_evals=15)
+best_params3 = parallel_fmin(
     fn=objective,               
     space=space3,               
     algo=tpe.suggest,          
-    max_evals=15,             
+    max_evals=max_evals3,             
     trials=trials3,           
-    rstate=np.random.default_rng(1234))
+    rstate=np.random.default_rng(1234),
+    n_jobs=TRIAL_JOBS,
+    pass_history=True,
+    startup_trials=pruner.n_startup_trials,
+    run=trial_store.run,
+    checkpoint=trial_store.checkpoint('XGB', space3))
 print("Best Parameters:", best_params3)
 best_params3['n_estimators'] = int(best_params3['n_estimators'])
 best_params3['max_depth'] = int(best_params3['max_depth'])
 best_params3['objective'] = ['binary:logistic', 'binary:hinge'][best_params3['objective']]
-XGB_algo = XGB(**best_params, use_label_encoder=False, random_state=1234)
-XGB_model=XGB_algo.fit(x_train, y_train)
-
-models=[RF_model,GBDT_model,XGB_model]
-names=['RF',"GBDT","XGB"]
-for i in range(3):
-  print(f"Model: {names[i]}")
-  predict=models[i].predict(x_train)
-  precision, recall, f1_score, _ = precision_recall_fscore_support(y_train, predict, average='macro')
-  accuracy= accuracy_score(y_train, predict)
-  print(f"Macro Precision: {precision}")
-  print(f"Macro Recall: {recall}")
-  print(f"Macro F1-score: {f1_score}")
-  print(f"Accuracy: {accuracy}")
+# Boosting rounds kept by early stopping in the best trial, as for GBDT
+best_result3 = best_trial(trials3, trial_store.run)['result']
+best_params3['n_estimators'] = best_result3.get('best_n_estimators', best_params3['n_estimators'])
+XGB_algo = make_model('XGB', best_params3, n_jobs=-1, random_state=1234)
+XGB_model=XGB_algo.fit(x_train_resampled, y_train_resampled)
+
+# Fit time and precision_macro of the default estimators against the multi-core / histogram backends
+if os.environ.get("RUN_BACKEND_BENCHMARK", "0") == "1":
+    print(benchmark_backends({'RF': best_params, 'GBDT': best_params2, 'XGB': best_params3},
+                             x_train_resampled, y_train_resampled, x_test, y_test))
+
+# Defining a function to print the scores of a model
+def print_scores(name, scores):
+  print(f"Model: {name}")
+  print(f"Macro Precision: {scores['precision_macro']}")
+  print(f"Macro Recall: {scores['recall_macro']}")
+  print(f"Macro F1-score: {scores['f1_macro']}")
+  print(f"Accuracy: {scores['accuracy']}")
   print("\n")
-  
+
+# Every model predicts once on each dataset (models in parallel); all scores below reuse those predictions
+datasets = {'train': (x_train_resampled, y_train_resampled), 'test': (x_test, y_test)}
+hyperopt_evaluation = ModelEvaluation({'RF': RF_model, 'GBDT': GBDT_model, 'XGB': XGB_model}, datasets).run()
+for name in hyperopt_evaluation.models:
+  print_scores(name, hyperopt_evaluation.metrics(name, 'train'))
+
 # Final score 
-for i in range(3):
-  print(f"Model: {names[i]}")
-  predict=models[i].predict(x_test)
-  precision, recall, f1_score, _ = precision_recall_fscore_support(y_test, predict, average='macro')
-  accuracy= accuracy_score(y_test, predict)
-  print(f"Macro Precision: {precision}")
-  print(f"Macro Recall: {recall}")
-  print(f"Macro F1-score: {f1_score}")
-  print(f"Accuracy: {accuracy}")
-  print("\n")
+for name in hyperopt_evaluation.models:
+  print_scores(name, hyperopt_evaluation.metrics(name, 'test'))
   
 # WITH HYPERPARAMETERS
 
-# Creating a hyperparameter search function for re-usability
-def random_search(algo, hyperparameters, x_train, y_train):
-  # do the search using 5 folds/chunks
-  clf = RandomizedSearchCV(algo, hyperparameters, cv=5, random_state=2024,
-                          scoring='precision_macro', n_iter=10, refit=True)
+# Search mode: 'halving' (default) tries 60 candidates with successive halving, small budgets first and
+# only the best third promoted each round; 'random' is the plain RandomizedSearchCV with 10 candidates
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "halving")
 
-  # Passing the data to fit/train
-  clf.fit(x_train, y_train)
-  return clf.best_params_
+# Creating a hyperparameter search function for re-usability
+# The model is searched behind the SMOTE stage, so each of the 5 folds is oversampled on its training part
+# Returns the best model (SMOTE + model pipeline), already refitted on the whole training data
+def random_search(algo, hyperparameters, x_train, y_train, mode=SEARCH_MODE, **halving_options):
+  if mode == 'halving':
+    # do the search using 5 folds/chunks, candidates of each round fitted in parallel
+    clf = halving_search(algo, hyperparameters, x_train, y_train, n_candidates=60, factor=3, cv=5,
+                         scoring='precision_macro', random_state=2024, n_jobs=-1, resampler=smote,
+                         **halving_options)
+  else:
+    algo, hyperparameters = with_resampler(algo, hyperparameters, smote)
+    # do the search using 5 folds/chunks
+    clf = RandomizedSearchCV(algo, hyperparameters, cv=5, random_state=2024,
+                            scoring='precision_macro', n_iter=10, refit=True, n_jobs=-1)
+
+    # Passing the data to fit/train
+    clf.fit(x_train, y_train)
+  print("Best Parameters:", clf.best_params_)
+  return clf.best_estimator_
 
 # Below are the 3 models
 
@@ -2030,56 +2013,50 @@ XGB_tuned_parameters = {
     'subsample': uniform(loc=0.3, scale=0.4),
     'colsample_bytree': uniform(loc=0.3, scale=0.4)}
 
-RF_best_params = random_search(RF_algo, RF_tuned_parameters, x_train, y_train)
-GBDT_best_params = random_search(GBDT_algo, GBDT_tuned_parameters, x_train, y_train)
-XGB_best_params = random_search(XGB_algo, XGB_tuned_parameters, x_train, y_train)
-
-#Training the model
-RF_algo = RF(**RF_best_params) 
-RF_model = RF_algo.fit(x_train, y_train)
-
-GBDT_algo = GBDT(**GBDT_best_params)
-GBDT_model = GBDT_algo.fit(x_train, y_train)
-
-XGB_algo = XGB(**XGB_best_params)
-XGB_model = XGB_algo.fit(x_train, y_train)
+#Training the model: the search refits the best candidate on x_train, so no second fit is needed
+# Random Forest budgets are numbers of trees (25 to 400), the boosting models' budgets are rows of x_train
+RF_model = random_search(RF_algo, RF_tuned_parameters, x_train, y_train,
+                         resource='n_estimators', min_resources=25, max_resources=400)
+GBDT_model = random_search(GBDT_algo, gbdt_params(GBDT_tuned_parameters, GBDT_ENGINE), x_train, y_train)
+XGB_model = random_search(XGB_algo, XGB_tuned_parameters, x_train, y_train)
 
 # Scoring the models
-models = [RF_model, GBDT_model, XGB_model] 
-names = ['Random Forest', 'GBDT', 'XGBDT']
-
-for i in range(3):
-  print(f"Model: {names[i]}")
-
-  # Predicting based on training data
-  predict = models[i].predict(x_test)
+search_evaluation = ModelEvaluation({'Random Forest': RF_model, 'GBDT': GBDT_model, 'XGBDT': XGB_model},
+                                    {'test': (x_test, y_test)}).run()
 
+for name in search_evaluation.models:
   # Calculating precision, recall, and F1-score
-  precision, recall, f1_score, _ = precision_recall_fscore_support(y_test, predict, average='macro')
-  accuracy = accuracy_score(y_test, predict) 
-  print(f"Macro Precision: {precision}")
-  print(f"Macro Recall: {recall}")
-  print(f"Macro F1-score: {f1_score}")
-  print(f"Accuracy: {accuracy}")
-  print("\n")
+  print_scores(name, search_evaluation.metrics(name, 'test'))
   
   # Checking accuracy on test data
-accuracy = accuracy_score(y_test, predict)
-print(f"Accuracy: {accuracy}")
+print(f"Accuracy: {search_evaluation.metrics('XGBDT', 'test')['accuracy']}")
 
-print(classification_report(y_test, predict))
+print(search_evaluation.classification_report('XGBDT', 'test'))
 
 plt.show()
 
 # Random Forest
 print("Random Forest Confusion Matrix")
-predict = RF_model.predict(x_test)
-print(CM.from_predictions(y_test, predict))
+print(search_evaluation.confusion_matrix('Random Forest', 'test'))
 
 
 # GBDT
 print("GBDT Confusion Matrix")
-predict = GBDT_model.predict(x_test)
-print(CM.from_predictions(y_test, predict))
+print(search_evaluation.confusion_matrix('GBDT', 'test'))
+
+# Precision and recall of each model at other decision thresholds than 0.5
+# (not for an XGB tuned to binary:hinge, whose probabilities are only 0 or 1)
+for name in search_evaluation.models:
+  print(f"Threshold sweep: {name}")
+  if search_evaluation.has_scores(name):
+    print(search_evaluation.threshold_sweep(name, 'test'))
+  else:
+    print("Not applicable: the model only predicts 0/1 probabilities (binary:hinge)")
+
+# Machine-readable copy of every score
+write_metrics("model_metrics.json", {'hyperopt': hyperopt_evaluation, 'random_search': search_evaluation})
 
 
+# Waiting for the background exports of Final_database to finish
+for pending_export in Final_database_exports:
+    pending_export.result()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import numpy as np
+import pandas as pd
+
+
+# Defining a function to turn the ordering column into sortable numbers: missing values (NaT/NaN) become
+# the smallest possible value, so they never win over a known value
+
+def _sort_values(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]').view(np.int64)  # NaT is the smallest int64
+    numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.where(np.isnan(numbers), -np.inf, numbers)
+
+
+# Defining a function to keep the latest row per key, e.g. the latest review of every order:
+# one factorize of the key and one lexsort on (key, order_by), then the last row of every group.
+#   - ties on order_by keep the first row in the original order (as groupby().idxmax())
+#   - missing order_by values lose to any known value; a group where order_by is missing on every row keeps
+#     its first row, or is dropped with keep_missing=False
+#   - rows with a missing key are dropped (as groupby)
+# The kept rows are returned in their original order.
+
+def latest_per_key(db, key, order_by, keep_missing=True):
+    codes, _ = pd.factorize(db[key])
+    values = _sort_values(db[order_by])
+    position = np.arange(len(db))
+
+    order = np.lexsort((-position, values, codes))
+    order = order[codes[order] >= 0]
+    sorted_codes = codes[order]
+    last = np.flatnonzero(np.r_[sorted_codes[1:] != sorted_codes[:-1], True]) if len(order) else order
+    keep = order[last]
+
+    if not keep_missing:
+        missing = db[order_by].isna().to_numpy()
+        keep = keep[~missing[keep]]
+    return db.iloc[np.sort(keep)]
+
+
+# Reductions available to aggregate_by_key: name -> function(group codes, values, number of groups).
+# Missing values are skipped, as in groupby().agg. New reductions are added with register_reduction.
+REDUCTIONS = {}
+
+
+def register_reduction(name):
+    def register(function):
+        REDUCTIONS[name] = function
+        return function
+    return register
+
+
+def _numbers(values):
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+# Defining a function to give integer codes of a column (-1 when missing) and its categories;
+# a categorical column keeps all its categories, so the outputs do not depend on which ones occur
+def _category_codes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.int64), values.cat.categories
+    return pd.factorize(values)
+
+
+# Largest (group, value) table nunique marks in a dense array before falling back to sorting
+DENSE_PAIRS = 50_000_000
+
+
+@register_reduction('count')
+def _count(codes, values, n_groups):
+    return np.bincount(codes[values.notna().to_numpy()], minlength=n_groups)
+
+
+@register_reduction('sum')
+def _sum(codes, values, n_groups):
+    numbers = _numbers(values)
+    return np.bincount(codes, weights=np.where(np.isnan(numbers), 0.0, numbers), minlength=n_groups)
+
+
+@register_reduction('mean')
+def _mean(codes, values, n_groups):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _sum(codes, values, n_groups) / _count(codes, values, n_groups)
+
+
+@register_reduction('max')
+def _max(codes, values, n_groups):
+    numbers = _numbers(values)
+    result = np.full(n_groups, -np.inf)
+    np.maximum.at(result, codes, np.where(np.isnan(numbers), -np.inf, numbers))
+    return np.where(np.isinf(result) & (result < 0), np.nan, result)
+
+
+@register_reduction('min')
+def _min(codes, values, n_groups):
+    return -_max(codes, -values, n_groups)
+
+
+@register_reduction('nunique')
+def _nunique(codes, values, n_groups):
+    value_codes, uniques = _category_codes(values)
+    n_values = max(len(uniques), 1)
+    known = value_codes >= 0
+    # Distinct (group, value) pairs, counted per group
+    pairs = codes[known] * np.int64(n_values) + value_codes[known]
+    if n_groups * n_values <= DENSE_PAIRS:
+        seen = np.zeros(n_groups * n_values, dtype=bool)
+        seen[pairs] = True
+        return seen.reshape(n_groups, n_values).sum(axis=1)
+    return np.bincount(np.unique(pairs) // n_values, minlength=n_groups)
+
+
+# Defining a function to aggregate a table to one row per key in one pass over its columns:
+# the key is factorized once and every aggregate is a bincount-style NumPy reduction on those codes.
+#   spec: output name -> (column, reduction), as the named aggregation of groupby().agg,
+#         or (column, 'share', by) for the share of the column's total per category of `by`
+#         (one output column per category, named "<output>_<category>")
+# Same values as groupby(key).agg(**spec); rows are in order of first appearance of the key.
+
+def aggregate_by_key(db, key, spec):
+    codes, keys = pd.factorize(db[key])
+    known = codes >= 0
+    if not known.all():
+        db, codes = db[known], codes[known]
+    n_groups = len(keys)
+
+    result = {key: keys}
+    for name, (column, reduction, *by) in spec.items():
+        if reduction == 'share':
+            by_codes, categories = _category_codes(db[by[0]])
+            numbers = _numbers(db[column])
+            valid = (by_codes >= 0) & ~np.isnan(numbers)
+            # Sum per (key, category) in one bincount, divided by the total of the key
+            totals = np.bincount(codes[valid] * len(categories) + by_codes[valid], weights=numbers[valid],
+                                 minlength=n_groups * len(categories)).reshape(n_groups, len(categories))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shares = totals / totals.sum(axis=1, keepdims=True)
+            for j, category in enumerate(categories):
+                result[f"{name}_{category}"] = shares[:, j]
+        else:
+            result[name] = REDUCTIONS[reduction](codes, db[column], n_groups)
+    return pd.DataFrame(result)
+
+
+# Defining a function to time aggregate_by_key against groupby().agg on the same spec and check they agree
+
+def benchmark_aggregate(db, key, spec, repeat=3):
+    import time
+
+    def best_time(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = function()
+            times.append(time.perf_counter() - start)
+        return min(times), output
+
+    agg_seconds, expected = best_time(lambda: db.groupby(key).agg(**spec).reset_index())
+    kernel_seconds, got = best_time(lambda: aggregate_by_key(db, key, spec))
+    got = got.set_index(key).loc[expected[key]].reset_index()
+    same = all(np.allclose(got[col].to_numpy(dtype=np.float64), expected[col].to_numpy(dtype=np.float64),
+                           equal_nan=True) for col in spec)
+    return {'agg_seconds': agg_seconds, 'kernel_seconds': kernel_seconds, 'same_result': same}
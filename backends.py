@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import time
+
+import pandas as pd
+from scipy import sparse
+from sklearn.ensemble import GradientBoostingClassifier as GBDT
+from sklearn.ensemble import HistGradientBoostingClassifier as HGBDT
+from sklearn.ensemble import RandomForestClassifier as RF
+from sklearn.metrics import precision_score
+from xgboost import XGBClassifier as XGB
+
+
+# GradientBoostingClassifier parameters and their HistGradientBoostingClassifier names.
+# None: no equivalent in the histogram engine, the parameter is dropped
+# (criterion is always the loss gradient, rows are not subsampled, leaf sizes use min_samples_leaf).
+HIST_GBDT_PARAMS = {
+    'n_estimators': 'max_iter',
+    'learning_rate': 'learning_rate',
+    'max_depth': 'max_depth',
+    'criterion': None,
+    'min_samples_split': None,
+    'subsample': None,
+}
+
+
+# Defining a function to translate GBDT parameters (values or search distributions) for an engine
+
+def gbdt_params(params, engine='exact'):
+    if engine == 'exact':
+        return dict(params)
+    return {HIST_GBDT_PARAMS.get(name, name): value for name, value in params.items()
+            if HIST_GBDT_PARAMS.get(name, name) is not None}
+
+
+# Defining a function to check that a training matrix suits the GBDT engine: HistGradientBoostingClassifier
+# only takes dense input, so the sparse model matrix needs the exact engine
+
+def check_engine(engine, x):
+    if engine == 'hist' and sparse.issparse(x):
+        raise ValueError("The 'hist' GBDT engine (HistGradientBoostingClassifier) does not accept a sparse "
+                         "matrix: build a dense model matrix or use engine='exact'")
+
+
+# Defining a function to create the final models with an explicit training backend:
+#   RF   -- trees built on n_jobs cores
+#   GBDT -- engine='exact' (GradientBoostingClassifier, single-threaded) or 'hist'
+#           (HistGradientBoostingClassifier, binned features, multi-threaded through OpenMP)
+#   XGB  -- tree_method='hist' on n_jobs threads
+
+def make_model(name, params, engine='exact', n_jobs=-1, random_state=1234):
+    if name == 'RF':
+        return RF(**params, n_jobs=n_jobs, random_state=random_state)
+    if name == 'GBDT':
+        if engine == 'hist':
+            return HGBDT(**gbdt_params(params, engine), early_stopping=False, random_state=random_state)
+        return GBDT(**params, random_state=random_state)
+    if name == 'XGB':
+        return XGB(**params, tree_method='hist', n_jobs=n_jobs, random_state=random_state)
+    raise ValueError(f"Unknown model {name!r}")
+
+
+# Defining a function to compare fit time and precision_macro of the current estimators (default threading,
+# exact GBDT) with the configured backends; params maps 'RF', 'GBDT' and 'XGB' to their hyperparameters
+
+def benchmark_backends(params, x_train, y_train, x_test, y_test, n_jobs=-1, random_state=1234):
+    candidates = [
+        ('RF', 'default', RF(**params['RF'], random_state=random_state)),
+        ('RF', f'n_jobs={n_jobs}', make_model('RF', params['RF'], n_jobs=n_jobs, random_state=random_state)),
+        ('GBDT', 'exact', make_model('GBDT', params['GBDT'], engine='exact', random_state=random_state)),
+        ('XGB', 'default', XGB(**params['XGB'], random_state=random_state)),
+        ('XGB', f'hist, n_jobs={n_jobs}', make_model('XGB', params['XGB'], n_jobs=n_jobs,
+                                                     random_state=random_state)),
+    ]
+    # The histogram GBDT is left out on a sparse matrix (see check_engine)
+    if not sparse.issparse(x_train):
+        candidates.insert(3, ('GBDT', 'hist', make_model('GBDT', params['GBDT'], engine='hist',
+                                                         random_state=random_state)))
+
+    rows = []
+    for name, backend, model in candidates:
+        start = time.perf_counter()
+        model.fit(x_train, y_train)
+        fit_seconds = time.perf_counter() - start
+        predict = model.predict(x_test)
+        rows.append({'Model': name, 'Backend': backend, 'Fit_Seconds': fit_seconds,
+                     'Precision_Macro': precision_score(y_test, predict, average='macro')})
+    return pd.DataFrame(rows)
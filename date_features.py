@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from working_days import WORKING_DAY_FEATURES, working_day_calendar, working_days_between
+
+
+# Nanoseconds per unit of the gap features
+UNIT_NS = {unit: np.timedelta64(1, unit).astype('timedelta64[ns]').astype(np.int64) for unit in ['D', 'h', 'm', 's']}
+
+# Gap features between two timestamp columns: (name, end column, start column, unit, working days).
+# Calendar gaps are whole units rounded down, as (end - start).dt.days; working-day gaps count the
+# working days between the two calendar dates, with working_days.working_days_between
+DATE_DIFF_FEATURES = [
+    # Days from Creation of the review to Answer
+    ('diff_review_creation_answer_days', 'review_answer_timestamp', 'review_creation_date', 'D', False),
+    # Days from Purchase to Approved
+    ('diff_approved_purchased', 'order_approved_at', 'order_purchase_timestamp', 'D', False),
+    # Days from Estimated Delivery to Customer Delivered
+    ('diff_customerdelivered_estimated', 'order_delivered_customer_date', 'order_estimated_delivery_date', 'D', False),
+    # Days from Carrier to Customer
+    ('diff_customerdelivered_deliveredcarrier', 'order_delivered_customer_date', 'order_delivered_carrier_date',
+     'D', False),
+    # Days from Purchase to Customer Delivered
+    ('diff_customerdelivered_purchase', 'order_delivered_customer_date', 'order_purchase_timestamp', 'D', False),
+    # Days from Purchase to Delivered Carrier
+    ('diff_deliveredcarrier_purchase', 'order_delivered_carrier_date', 'order_purchase_timestamp', 'D', False),
+] + [
+    # Working days from Purchased to Approved, from Carrier to Customer Delivered and from Purchase to Delivered Carrier
+    (name, end, start, 'D', True) for name, start, end in WORKING_DAY_FEATURES
+]
+
+
+# Defining a function to compute every gap of the spec in one pass: for the calendar gaps each timestamp column
+# is read once as int64 nanoseconds (NaT as a mask), and each feature is one integer subtraction on those
+# arrays; the working-day gaps use working_days.working_days_between with one shared calendar.
+# Returns name -> float32 array (whole numbers, NaN where either timestamp is missing).
+# Pass holidays=brazil_national_holidays(range(2016, 2019)) to skip national holidays in working days.
+
+def date_diffs(db, spec=DATE_DIFF_FEATURES, holidays=None):
+    columns = {col for _, end, start, _, working_days in spec if not working_days for col in (end, start)}
+    nanoseconds, missing = {}, {}
+    for col in columns:
+        values = pd.to_datetime(db[col]).to_numpy(dtype='datetime64[ns]')
+        nanoseconds[col], missing[col] = values.view(np.int64), np.isnat(values)
+
+    # One calendar shared by every working-day feature
+    busdaycal = working_day_calendar(holidays)
+
+    result = {}
+    for name, end, start, unit, working_days in spec:
+        if working_days:
+            # Holidays and calendar-day truncation are handled in one place (see working_days)
+            result[name] = working_days_between(db[start], db[end], busdaycal=busdaycal).astype(np.float32)
+            continue
+        valid = ~(missing[end] | missing[start])
+        output = np.full(len(db), np.nan, dtype=np.float32)
+        output[valid] = np.floor_divide(nanoseconds[end][valid] - nanoseconds[start][valid], UNIT_NS[unit])
+        result[name] = output
+    return result
+
+
+# Defining a function to add the gap features to db (one new column each, no other copy of db)
+
+def add_date_features(db, spec=DATE_DIFF_FEATURES, holidays=None):
+    for name, values in date_diffs(db, spec, holidays).items():
+        db[name] = values
+    return db
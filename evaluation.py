@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import json
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.metrics import ConfusionMatrixDisplay as CM
+from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
+
+
+# Defining a function to run inference once: probability of the positive class and predicted labels
+# (the labels are derived from the probabilities at 0.5, as predict does for these binary models)
+
+def _infer(model, x):
+    proba = model.predict_proba(x)[:, 1]
+    return proba, np.asarray(model.classes_)[(proba > 0.5).astype(np.int64)]
+
+
+# Objectives whose predict_proba only gives 0 or 1: every threshold gives the same labels
+HARD_OBJECTIVES = {'binary:hinge'}
+
+
+# Defining a function to tell whether a model's probabilities can be thresholded (also through a Pipeline)
+
+def _has_scores(model):
+    params = model.get_params() if hasattr(model, 'get_params') else {}
+    return not any(value in HARD_OBJECTIVES for name, value in params.items()
+                   if name == 'objective' or name.endswith('__objective'))
+
+
+# Defining a function to compute the macro metrics printed by the script
+
+def _metrics(y, predict):
+    precision, recall, f1_score, _ = precision_recall_fscore_support(y, predict, average='macro', zero_division=0)
+    return {'precision_macro': float(precision), 'recall_macro': float(recall),
+            'f1_macro': float(f1_score), 'accuracy': float(accuracy_score(y, predict))}
+
+
+# Evaluates several models on several datasets. Inference runs once per (model, dataset), models in parallel
+# threads, and every metric, report, confusion matrix and threshold sweep is derived from the cached outputs.
+# models: name -> fitted classifier; datasets: name -> (x, y)
+
+class ModelEvaluation:
+
+    def __init__(self, models, datasets, n_jobs=-1):
+        self.models = dict(models)
+        self.datasets = dict(datasets)
+        self.n_jobs = n_jobs
+        self.proba_ = {}
+        self.predictions_ = {}
+
+    # Defining a function to run the inference that is not cached yet
+    def run(self):
+        pending = [(model, dataset) for model in self.models for dataset in self.datasets
+                   if (model, dataset) not in self.proba_]
+        outputs = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(_infer)(self.models[model], self.datasets[dataset][0]) for model, dataset in pending)
+        for key, (proba, predict) in zip(pending, outputs):
+            self.proba_[key], self.predictions_[key] = proba, predict
+        return self
+
+    def _outputs(self, model, dataset):
+        if (model, dataset) not in self.proba_:
+            self.run()
+        return self.datasets[dataset][1], self.proba_[model, dataset], self.predictions_[model, dataset]
+
+    # Defining a function to give precision, recall and F1 (macro) and accuracy
+    def metrics(self, model, dataset):
+        y, _, predict = self._outputs(model, dataset)
+        return _metrics(y, predict)
+
+    def classification_report(self, model, dataset, **kwargs):
+        y, _, predict = self._outputs(model, dataset)
+        return classification_report(y, predict, **kwargs)
+
+    def confusion_matrix(self, model, dataset, **kwargs):
+        y, _, predict = self._outputs(model, dataset)
+        return CM.from_predictions(y, predict, **kwargs)
+
+    # Defining a function to tell whether threshold_sweep applies to a model (not to binary:hinge XGBoost)
+    def has_scores(self, model):
+        return _has_scores(self.models[model])
+
+    # Defining a function to give the metrics at every decision threshold on the positive-class probability
+    def threshold_sweep(self, model, dataset, thresholds=np.round(np.arange(0.05, 1.0, 0.05), 2)):
+        if not self.has_scores(model):
+            raise ValueError(f"{model!r} only outputs 0/1 probabilities (binary:hinge), "
+                             "a threshold sweep does not apply")
+        y, proba, _ = self._outputs(model, dataset)
+        classes = np.asarray(self.models[model].classes_)
+        rows = [{'threshold': float(t), **_metrics(y, classes[(proba > t).astype(np.int64)])} for t in thresholds]
+        return pd.DataFrame(rows)
+
+    # Defining a function to give every metric of every (model, dataset)
+    def to_dict(self):
+        self.run()
+        return {model: {dataset: self.metrics(model, dataset) for dataset in self.datasets}
+                for model in self.models}
+
+
+# Defining a function to write the metrics of one or more evaluations as JSON; evaluations: label -> ModelEvaluation
+
+def write_metrics(path, evaluations):
+    with open(path, 'w') as f:
+        json.dump({label: evaluation.to_dict() for label, evaluation in evaluations.items()}, f, indent=2)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Rows written per Parquet row group / per batch of spreadsheet rows
+CHUNK_ROWS = 65536
+
+# Excel's hard limit per worksheet, including the header row
+XLSX_MAX_ROWS = 1048576
+
+
+# Defining a Parquet sink that writes one row group per chunk
+
+def write_parquet(db, path, chunk_rows=CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(db, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, len(db), chunk_rows):
+            chunk = db.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# Defining a streaming xlsx sink: rows are flushed to disk as they are written (constant memory)
+# Extracts above the worksheet limit continue on new sheets
+
+def write_xlsx(db, path, chunk_rows=CHUNK_ROWS):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'remove_timezone': True,
+                                          'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    header = [str(col) for col in db.columns]
+
+    worksheet, row = None, XLSX_MAX_ROWS
+    for start in range(0, len(db), chunk_rows):
+        chunk = db.iloc[start:start + chunk_rows]
+        # Missing values become empty cells
+        values = chunk.astype(object).where(chunk.notna(), None).to_numpy()
+        for record in values:
+            if row == XLSX_MAX_ROWS:
+                worksheet = workbook.add_worksheet()
+                worksheet.write_row(0, 0, header)
+                row = 1
+            worksheet.write_row(row, 0, record)
+            row += 1
+
+    if worksheet is None:
+        workbook.add_worksheet().write_row(0, 0, header)
+    workbook.close()
+
+
+# Available sinks, chosen by file extension
+SINKS = {
+    '.parquet': write_parquet,
+    '.xlsx': write_xlsx,
+}
+
+# One background writer shared by all exports, so they do not compete with each other
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+
+# Defining a function to export a table; by default it runs in the background and returns a Future
+
+def export_table(db, path, sink=None, chunk_rows=CHUNK_ROWS, background=True):
+    sink = sink or SINKS[os.path.splitext(path)[1].lower()]
+    # Export a snapshot, so later changes to db do not leak into the file
+    db = db.copy()
+    if not background:
+        sink(db, path, chunk_rows)
+        return None
+    return _executor.submit(sink, db, path, chunk_rows)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import json
+import os
+from functools import partial
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from date_features import DATE_DIFF_FEATURES
+from features import build_final_database
+from pipeline import DERIVED_COLUMNS, MODEL_COLUMNS, PAYMENT_AGGREGATES, prune_columns
+
+
+# Tables with one or more rows per order: a change in any of their rows changes that order's features
+ORDER_TABLES = ['Order_items', 'Order_Status', 'Order_Payments', 'Order_Reviews']
+
+# Tables reached from an order through a key of Order_Status: Olist issues a customer_id per order, so a new
+# order comes with a new Customers row, which only changes that order's fingerprint
+ORDER_LINKED_TABLES = {'Customers': 'customer_id'}
+
+# Lookup tables shared by many orders: a change in any of them triggers a full rebuild.
+# Geolocation is not digested here (about 1M rows on every update): it only reaches the features through the
+# zip centroids, which are passed to the store as a lookup (see FeatureStore)
+DIMENSION_TABLES = ['Products', 'Sellers', 'Product_Categories']
+
+
+# Defining a function to fingerprint every order from the rows of the order-level tables
+
+def order_fingerprints(tables):
+    order_ids = pd.Index(pd.concat([tables[name]['order_id'] for name in ORDER_TABLES], ignore_index=True).unique())
+    fingerprint = np.zeros(len(order_ids), dtype=np.uint64)
+    for i, name in enumerate(ORDER_TABLES):
+        db = tables[name]
+        # Sum of row hashes per order: independent of row order, wraps around in uint64
+        row_hashes = pd.util.hash_pandas_object(db, index=False).to_numpy() * np.uint64(2 * i + 1)
+        np.add.at(fingerprint, order_ids.get_indexer(db['order_id']), row_hashes)
+
+    # Rows of the linked tables are added to the orders pointing at them
+    Order_Status = tables['Order_Status']
+    for i, (name, key) in enumerate(ORDER_LINKED_TABLES.items(), start=len(ORDER_TABLES)):
+        db = tables[name]
+        row_hashes = pd.util.hash_pandas_object(db, index=False).to_numpy() * np.uint64(2 * i + 1)
+        rows = pd.Index(db[key]).get_indexer(Order_Status[key])
+        linked = rows >= 0
+        np.add.at(fingerprint, order_ids.get_indexer(Order_Status['order_id'][linked]), row_hashes[rows[linked]])
+    return pd.Series(fingerprint, index=order_ids, name='fingerprint')
+
+
+# Defining a function to digest a whole lookup table
+
+def _table_digest(db):
+    return str(int(np.add.reduce(pd.util.hash_pandas_object(db, index=False).to_numpy(), dtype=np.uint64)))
+
+
+# Defining a function to digest the feature definitions: the build function with its arguments (e.g. a
+# functools.partial holding holidays or the seller index) and the declared columns and features. A store
+# written by another version of the feature code (e.g. before a new model column) is then fully rebuilt
+
+def feature_version(build):
+    if isinstance(build, partial):
+        # Arguments with a fingerprint (e.g. spatial_index.SpatialIndex) are digested through it
+        build = (build.func, [_definition(value) for value in build.args],
+                 {name: _definition(value) for name, value in build.keywords.items()})
+    return joblib.hash((build, prune_columns(), MODEL_COLUMNS, DERIVED_COLUMNS, PAYMENT_AGGREGATES,
+                        DATE_DIFF_FEATURES))
+
+
+def _definition(value):
+    return value.fingerprint() if hasattr(value, 'fingerprint') else value
+
+
+# Defining a function to name the partition (purchase month) of every order
+
+def _order_partitions(Order_Status):
+    months = Order_Status['order_purchase_timestamp'].dt.strftime('%Y-%m').fillna('unknown')
+    return pd.Series(months.to_numpy(), index=Order_Status['order_id'].to_numpy(), name='partition')
+
+
+# On-disk store of Final_database rows (key order_id_product_id), partitioned by purchase month.
+# Only the orders whose source rows changed since the last update are rebuilt.
+# lookups: precomputed inputs that build already holds (e.g. {'zip_centroids': centroids}); they are
+# fingerprinted like the lookup tables, so a change in any of them triggers a full rebuild
+
+class FeatureStore:
+
+    def __init__(self, path, build=build_final_database, lookups=None):
+        self.path = path
+        self.build = build
+        self.lookups = lookups or {}
+
+    def _partition_path(self, partition):
+        return os.path.join(self.path, f"part-{partition}.parquet")
+
+    def _read_partition(self, partition):
+        path = self._partition_path(partition)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def _write(self, db, path):
+        # Write to a temporary file first so an interrupted update never leaves a half-written partition
+        tmp_path = path + ".tmp"
+        db.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, "_manifest.parquet")
+        dimensions_path = os.path.join(self.path, "_dimensions.json")
+        if not (os.path.exists(manifest_path) and os.path.exists(dimensions_path)):
+            return None, None
+        manifest = pd.read_parquet(manifest_path).set_index('order_id')
+        with open(dimensions_path) as f:
+            dimensions = json.load(f)
+        return manifest, dimensions
+
+    def _write_manifest(self, manifest, dimensions):
+        self._write(manifest.rename_axis('order_id').reset_index(), os.path.join(self.path, "_manifest.parquet"))
+        with open(os.path.join(self.path, "_dimensions.json"), 'w') as f:
+            json.dump(dimensions, f)
+
+    # Defining a function to bring the store up to date with the source tables; returns the number of rebuilt orders
+    def update(self, tables):
+        os.makedirs(self.path, exist_ok=True)
+
+        current = pd.concat([order_fingerprints(tables), _order_partitions(tables['Order_Status'])], axis=1)
+        current['partition'] = current['partition'].fillna('unknown')
+        dimensions = {name: _table_digest(tables[name]) for name in DIMENSION_TABLES}
+        dimensions.update({name: joblib.hash(lookup) for name, lookup in self.lookups.items()})
+        dimensions['features'] = feature_version(self.build)
+        previous, previous_dimensions = self._read_manifest()
+
+        if previous is None or previous_dimensions != dimensions:
+            # First run, a lookup table changed or the features changed: every order is rebuilt
+            changed = current.index
+            removed = pd.Index([]) if previous is None else previous.index.difference(current.index)
+        else:
+            known = current.index.intersection(previous.index)
+            modified = known[current.loc[known, 'fingerprint'].to_numpy() != previous.loc[known, 'fingerprint'].to_numpy()]
+            changed = current.index.difference(previous.index).append(modified)
+            removed = previous.index.difference(current.index)
+
+        # total_purchase_count is per customer, so every order of a customer with a changed or removed order is
+        # rebuilt; the manifest keeps each order's customer, so a customer_unique_id that changed also refreshes
+        # the orders of the customer it was moved away from
+        Order_Status, Customers = tables['Order_Status'], tables['Customers']
+        order_customer = Order_Status[['order_id', 'customer_id']].merge(
+            Customers[['customer_id', 'customer_unique_id']], how='left', on='customer_id')
+        current['customer_unique_id'] = order_customer.set_index('order_id')['customer_unique_id'].reindex(current.index)
+        touched = current.loc[changed, 'customer_unique_id']
+        if previous is not None and 'customer_unique_id' in previous:
+            touched = pd.concat([touched, previous.loc[previous.index.intersection(changed.union(removed)),
+                                                       'customer_unique_id']])
+        changed = changed.union(current.index[current['customer_unique_id'].isin(touched.dropna())])
+
+        if len(changed) == 0 and len(removed) == 0:
+            return 0
+
+        # Recompute the features only for the changed orders
+        subset = {name: db[db['order_id'].isin(changed)] if name in ORDER_TABLES else db
+                  for name, db in tables.items()}
+        # Only the linked rows of the changed orders are needed
+        for name, key in ORDER_LINKED_TABLES.items():
+            keys = Order_Status.loc[Order_Status['order_id'].isin(changed), key]
+            subset[name] = tables[name][tables[name][key].isin(keys)]
+        rows = self.build(subset)
+        row_partitions = current['partition'].reindex(rows['order_id'].to_numpy()).to_numpy()
+
+        # Overwrite only the partitions holding changed or removed orders
+        stale = changed.union(removed)
+        partitions = set(current.loc[current.index.intersection(changed), 'partition'])
+        if previous is not None:
+            partitions |= set(previous.loc[previous.index.intersection(stale), 'partition'])
+
+        for partition in sorted(partitions):
+            existing = self._read_partition(partition)
+            new_rows = rows[row_partitions == partition]
+            if existing is not None:
+                existing = existing[~existing['order_id'].isin(stale)]
+                new_rows = pd.concat([existing, new_rows], ignore_index=True)
+            if len(new_rows):
+                self._write(new_rows, self._partition_path(partition))
+            elif existing is not None:
+                os.remove(self._partition_path(partition))
+
+        self._write_manifest(current, dimensions)
+        return len(changed)
+
+    # Defining a function to read the whole store, in a stable row order
+    def load(self):
+        parts = [pd.read_parquet(os.path.join(self.path, name))
+                 for name in sorted(os.listdir(self.path)) if name.startswith("part-") and name.endswith(".parquet")]
+        if not parts:
+            return pd.DataFrame()
+        db = pd.concat(parts, ignore_index=True)
+        return db.sort_values('order_id_product_id', kind='mergesort', ignore_index=True)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from aggregations import aggregate_by_key, latest_per_key
+from date_features import add_date_features, DATE_DIFF_FEATURES
+from geo import add_shipping_distance, zip_centroids
+from ids import pack_ids
+from joins import join_dimensions
+from pipeline import (DERIVED_COLUMNS, FILTER_COLUMNS, MODEL_COLUMNS, ORDER_FEATURES, PAYMENT_AGGREGATES,
+                      prune_columns)
+from spatial_index import add_seller_density, fill_missing_prefixes, seller_index
+
+
+# Defining a function to count the order items of every order's customer (customer_unique_id), on the order
+# grain of Order_Status: items per order with one bincount, summed per customer, then broadcast back to the orders.
+# Same values as Final_database.groupby('customer_unique_id')['order_id'].transform('count');
+# NaN for orders whose customer is unknown
+
+def total_purchase_count(Order_items, Order_Status, Customers):
+    item_orders = pd.Index(Order_Status['order_id']).get_indexer(Order_items['order_id'])
+    items_per_order = np.bincount(item_orders[item_orders >= 0], minlength=len(Order_Status))
+
+    customer_rows = pd.Index(Customers['customer_id']).get_indexer(Order_Status['customer_id'])
+    unique_ids = Customers['customer_unique_id'].to_numpy()[np.where(customer_rows >= 0, customer_rows, 0)]
+    customer_codes, customers = pd.factorize(pd.Series(unique_ids).where(customer_rows >= 0))
+    known = customer_codes >= 0
+
+    per_customer = np.bincount(customer_codes[known], weights=items_per_order[known], minlength=len(customers))
+    counts = np.full(len(Order_Status), np.nan)
+    counts[known] = per_customer[customer_codes[known]]
+    return counts.astype(np.int64) if known.all() else counts
+
+
+# Defining a function to select the gap features whose two timestamps are both columns of db
+
+def _features_of(spec, db):
+    return [feature for feature in spec if feature[1] in db and feature[2] in db]
+
+
+# Defining a function to build Final_database (one row per order item) from the source tables
+# tables: dict of table name -> DataFrame, as returned by loading.load_tables
+# centroids: geo.ZipCentroids, built from tables['Geolocation'] when not given
+# sellers: spatial_index.SpatialIndex of the seller locations, built from tables['Sellers'] when not given
+
+def build_final_database(tables, plan=None, holidays=None, centroids=None, sellers=None):
+    # Columns each table must provide (see pipeline.prune_columns)
+    plan = prune_columns() if plan is None else plan
+
+    #  Consolidation of databases to connect databases
+
+    # Consolidating Order_Payments to have 1 row per order_id, computing only the aggregates that are used
+    # (all of them in one pass over the factorized order_id)
+    Order_Payments2 = aggregate_by_key(
+        tables['Order_Payments'][plan['Order_Payments']], "order_id",
+        {name: agg for name, agg in PAYMENT_AGGREGATES.items() if name in plan['Order_Payments2']}
+    )
+
+    # Consolidating Order_Reviews keeping the latest value for each order_id based on review_creation_date
+    # (an order whose reviews all lack a creation date keeps its first review)
+    Order_Reviews2 = latest_per_key(tables['Order_Reviews'][plan['Order_Reviews']], 'order_id', 'review_creation_date')
+
+    Order_Status = tables['Order_Status'][plan['Order_Status']]
+    Customers = tables['Customers'][plan['Customers']]
+
+    # III. CREATING NEW FEATURES FOR MODELLING
+    # Order- and customer-level features are computed once per order, on Order_Status (~99k rows) and
+    # Order_Reviews2, then reach the items through the join
+
+    # Total_purchase_count as the total number of purchases (order items) of the customer
+    Order_Status = Order_Status.assign(
+        total_purchase_count=total_purchase_count(tables['Order_items'], Order_Status, Customers))
+
+    # Days between the order, delivery and review timestamps, calendar and working days
+    # (see date_features.DATE_DIFF_FEATURES), each computed on the order-level table holding both timestamps
+    # in one pass over its timestamp columns; a gap between two tables is computed after the join
+    # Pass holidays=brazil_national_holidays(range(2016, 2019)) to skip national holidays
+    Order_Status = add_date_features(Order_Status, _features_of(DATE_DIFF_FEATURES, Order_Status), holidays)
+    Order_Reviews2 = add_date_features(Order_Reviews2.copy(), _features_of(DATE_DIFF_FEATURES, Order_Reviews2),
+                                       holidays)
+    item_features = [feature for feature in DATE_DIFF_FEATURES
+                     if feature[0] not in Order_Status and feature[0] not in Order_Reviews2]
+
+    # The inputs of the order features (raw timestamps, customer_unique_id) stay out of the wide table
+    # unless a model column or an item-level feature needs them; the join keys are always kept
+    consumed = ({col for name in ORDER_FEATURES for col in DERIVED_COLUMNS[name]}
+                - set(MODEL_COLUMNS) - set(FILTER_COLUMNS) - {'order_id', 'customer_id'}
+                - {col for _, end, start, _, _ in item_features for col in (end, start)})
+    Order_Status, Order_Reviews2, Customers = (db[[col for col in db.columns if col not in consumed]]
+                                               for db in (Order_Status, Order_Reviews2, Customers))
+
+    # Creating the database from Order_items -- 112650, connected in one pass to:
+    #   Products, Sellers, Order_Status, Order_Payments2, Order_Reviews2, Customers and Product_Categories
+    # Every table is unique on its key, so each join is a lookup of row positions instead of a merge copy
+    Final_database = join_dimensions(tables['Order_items'][plan['Order_items']], [
+        (tables['Products'][plan['Products']], 'product_id'),
+        (tables['Sellers'][plan['Sellers']], 'seller_id'),
+        (Order_Status, 'order_id'),
+        (Order_Payments2, 'order_id'),
+        (Order_Reviews2, 'order_id'),
+        (Customers, 'customer_id'),
+        (tables['Product_Categories'][plan['Product_Categories']], 'product_category_name'),
+    ])
+    if item_features:
+        Final_database = add_date_features(Final_database, item_features, holidays)
+
+    # Product payment value as the sum of price and freight value
+    Final_database['product_payment_value']=Final_database['price']+Final_database['freight_value']
+
+    # Freight_to_price_ratio as the ratio of Freight over Price
+    Final_database['freight_to_price_ratio'] = Final_database['freight_value'] / Final_database['price']
+
+    # Distance in km between the customer's and the seller's zip prefix centroids, and number of sellers
+    # within 50 km of the customer; prefixes missing from Geolocation take the closest known prefix
+    if 'Geolocation' in plan:
+        if centroids is None:
+            centroids = fill_missing_prefixes(zip_centroids(tables['Geolocation']))
+        Final_database = add_shipping_distance(Final_database, centroids)
+        sellers = seller_index(tables['Sellers'], centroids) if sellers is None else sellers
+        Final_database = add_seller_density(Final_database, centroids, sellers, radius_km=50)
+
+    # Creating index Order_id + Product_id: both codes packed in one int64 when the IDs are encoded
+    # (see ids.IdDictionary), otherwise the two strings joined with '-'
+    if pd.api.types.is_integer_dtype(Final_database['order_id']):
+        Final_database['order_id_product_id'] = pack_ids(Final_database['order_id'], Final_database['product_id'])
+    else:
+        Final_database['order_id_product_id'] = Final_database['order_id'] +'-'+ Final_database['product_id']
+
+    return Final_database
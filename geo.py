@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+# Zip code prefixes are the first 5 digits of the CEP, so they fit an array index
+N_ZIP_PREFIXES = 100000
+
+# Mean Earth radius used by the haversine distance
+EARTH_RADIUS_KM = 6371.0088
+
+# Bounding box of Brazil: Geolocation has a few points elsewhere in the world, which are ignored
+BRAZIL_LAT = (-34.0, 5.5)
+BRAZIL_LNG = (-74.0, -34.0)
+
+
+# Centroid of every zip code prefix, as dense arrays indexed by the prefix (NaN when the prefix is unknown)
+
+@dataclass
+class ZipCentroids:
+    lat: np.ndarray
+    lng: np.ndarray
+    points: np.ndarray
+
+    # Defining a function to give the centroid of each prefix; unknown or missing prefixes give NaN
+    def lookup(self, prefixes):
+        prefixes = pd.to_numeric(pd.Series(prefixes), errors='coerce').to_numpy(dtype=np.float64)
+        valid = (prefixes >= 0) & (prefixes < len(self.lat))
+        position = np.where(valid, prefixes, 0).astype(np.int64)
+        lat = np.where(valid, self.lat[position], np.nan)
+        lng = np.where(valid, self.lng[position], np.nan)
+        return lat, lng
+
+    @property
+    def known(self):
+        return np.flatnonzero(self.points > 0)
+
+    def save(self, path):
+        np.savez(path, lat=self.lat, lng=self.lng, points=self.points)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['lat'], f['lng'], f['points'])
+
+
+# Defining a function to build the centroids from Geolocation in one vectorised pass:
+# duplicated coordinates are counted once, then the coordinates are averaged per prefix with bincount
+
+def zip_centroids(Geolocation):
+    points = Geolocation[['geolocation_zip_code_prefix', 'geolocation_lat', 'geolocation_lng']].dropna()
+    inside = (points['geolocation_lat'].between(*BRAZIL_LAT) & points['geolocation_lng'].between(*BRAZIL_LNG))
+    points = points[inside].drop_duplicates()
+
+    prefix = points['geolocation_zip_code_prefix'].to_numpy(dtype=np.int64)
+    counts = np.bincount(prefix, minlength=N_ZIP_PREFIXES)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lat = np.bincount(prefix, weights=points['geolocation_lat'].to_numpy(), minlength=N_ZIP_PREFIXES) / counts
+        lng = np.bincount(prefix, weights=points['geolocation_lng'].to_numpy(), minlength=N_ZIP_PREFIXES) / counts
+    return ZipCentroids(lat.astype(np.float32), lng.astype(np.float32), counts.astype(np.int32))
+
+
+# Defining a function to compute the great-circle distance in km between two arrays of coordinates
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Defining a function to add the customer-to-seller distance of every order item (NaN if a prefix is unknown)
+
+def add_shipping_distance(db, centroids, name='customer_seller_distance_km',
+                          customer_col='customer_zip_code_prefix', seller_col='seller_zip_code_prefix'):
+    customer_lat, customer_lng = centroids.lookup(db[customer_col])
+    seller_lat, seller_lng = centroids.lookup(db[seller_col])
+    db[name] = haversine_km(customer_lat, customer_lng, seller_lat, seller_lng)
+    return db
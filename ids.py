@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# ID columns of the Olist tables and the kind of entity they identify: a column of the same kind in any
+# table gets the same codes (order_id in Order_items, Order_Status, Order_Payments and Order_Reviews)
+ID_COLUMNS = {
+    'order_id': 'order',
+    'customer_id': 'customer',
+    'customer_unique_id': 'customer_unique',
+    'product_id': 'product',
+    'seller_id': 'seller',
+    'review_id': 'review',
+}
+
+# Code of a missing ID
+MISSING_ID = -1
+
+
+# Global dictionary of the 32-character hex IDs: every ID of a kind gets a compact int32 code, in order of
+# first appearance. Codes are only ever appended, so once saved they stay the same from run to run
+# (the feature store and the trained models can rely on them).
+
+class IdDictionary:
+
+    def __init__(self, path=None):
+        self.path = path
+        self.vocabularies = {kind: pd.Index([], dtype=object) for kind in set(ID_COLUMNS.values())}
+        if path is not None and os.path.exists(path):
+            saved = pd.read_parquet(path)
+            for kind, ids in saved.groupby('kind', sort=False)['id']:
+                # Rows are saved in code order
+                self.vocabularies[kind] = pd.Index(ids.to_numpy(dtype=object), dtype=object)
+
+    # Defining a function to give the codes of some IDs, adding the IDs seen for the first time
+    def encode(self, kind, values):
+        values = pd.Series(values)
+        vocabulary = self.vocabularies[kind]
+        codes = vocabulary.get_indexer(values)
+        missing = values.isna().to_numpy()
+        new = (codes < 0) & ~missing
+        if new.any():
+            # One lookup for the unseen IDs, numbered after the known ones in order of first appearance
+            new_codes, new_ids = pd.factorize(values[new])
+            self.vocabularies[kind] = vocabulary.append(pd.Index(new_ids.to_numpy(dtype=object), dtype=object))
+            codes[new] = len(vocabulary) + new_codes
+        codes[missing] = MISSING_ID
+        return codes.astype(np.int32)
+
+    # Defining a function to give the IDs of some codes (None for MISSING_ID)
+    def decode(self, kind, codes):
+        codes = np.asarray(codes)
+        ids = self.vocabularies[kind].to_numpy()[np.where(codes >= 0, codes, 0)]
+        return np.where(codes >= 0, ids, None)
+
+    # Defining a function to replace the ID columns of a table with their codes
+    def encode_table(self, db):
+        db = db.copy()
+        for col, kind in ID_COLUMNS.items():
+            if col in db and not pd.api.types.is_integer_dtype(db[col]):
+                db[col] = self.encode(kind, db[col])
+        return db
+
+    # Defining a function to put the original IDs back in a table (e.g. for a business-facing export); a packed
+    # order_id_product_id key becomes the two IDs joined with '-' again
+    def decode_table(self, db):
+        db = db.copy()
+        if 'order_id_product_id' in db and pd.api.types.is_integer_dtype(db['order_id_product_id']):
+            order_codes, product_codes = unpack_ids(db['order_id_product_id'])
+            db['order_id_product_id'] = (pd.Series(self.decode('order', order_codes), index=db.index) + '-'
+                                         + pd.Series(self.decode('product', product_codes), index=db.index))
+        for col, kind in ID_COLUMNS.items():
+            if col in db and pd.api.types.is_integer_dtype(db[col]):
+                db[col] = self.decode(kind, db[col])
+        return db
+
+    def save(self, path=None):
+        path = path or self.path
+        saved = pd.concat([pd.DataFrame({'kind': kind, 'id': vocabulary.to_numpy(dtype=object)})
+                           for kind, vocabulary in sorted(self.vocabularies.items())], ignore_index=True)
+        tmp_path = path + ".tmp"
+        saved.astype({'kind': 'category', 'id': 'str'}).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+# Defining functions to pack two int32 codes into one int64 key (e.g. order_id_product_id) and back
+
+def pack_ids(high, low):
+    high = np.asarray(high, dtype=np.int64)
+    low = np.asarray(low, dtype=np.int64)
+    return (high << 32) | (low & 0xFFFFFFFF)
+
+
+def unpack_ids(key):
+    key = np.asarray(key, dtype=np.int64)
+    return (key >> 32).astype(np.int32), (key & 0xFFFFFFFF).astype(np.uint32).astype(np.int32)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import pandas as pd
+from pandas.api.extensions import take
+
+
+# Defining a function to left-join a chain of dimension tables onto a fact table in one allocation
+# steps: list of (dimension table, key column); the key may come from the fact table or an earlier dimension
+
+def join_dimensions(fact, steps):
+    # Columns of the wide frame, kept as arrays until the end
+    columns = {col: fact[col].array for col in fact.columns}
+
+    # Each key column is factorized once and shared by every dimension joined on it
+    key_codes = {}
+
+    for dim, key in steps:
+        if not dim[key].is_unique:
+            raise ValueError(f"Dimension table is not unique on '{key}'")
+        overlap = [col for col in dim.columns if col != key and col in columns]
+        if overlap:
+            raise ValueError(f"Columns {overlap} would be duplicated by the join on '{key}'")
+
+        if key not in key_codes:
+            # NaN keys get a code of their own, so they match NaN in the dimension like merge does
+            key_codes[key] = pd.factorize(columns[key], use_na_sentinel=False)
+        codes, uniques = key_codes[key]
+
+        # Look up only the distinct keys, then broadcast the row positions to every fact row
+        positions = pd.Index(dim[key]).get_indexer(uniques)[codes]
+
+        # Missing keys (-1) become NaN / NaT, as in a left merge
+        for col in dim.columns:
+            if col != key:
+                columns[col] = take(dim[col].array, positions, allow_fill=True)
+
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+# Folder holding the columnar copies of the CSVs
+CACHE_DIR = ".olist_cache"
+
+# Declared schema per table: source file, columns to read, dtypes, categorical and datetime columns
+SCHEMAS = {
+    'Customers': {
+        'file': "olist_customers_dataset.csv",
+        'columns': ['customer_id', 'customer_unique_id', 'customer_zip_code_prefix',
+                    'customer_city', 'customer_state'],
+        'dtype': {'customer_zip_code_prefix': 'int32'},
+        'categorical': ['customer_city', 'customer_state'],
+        'datetime': [],
+    },
+    'Geolocation': {
+        'file': "olist_geolocation_dataset.csv",
+        'columns': ['geolocation_zip_code_prefix', 'geolocation_lat', 'geolocation_lng',
+                    'geolocation_city', 'geolocation_state'],
+        'dtype': {'geolocation_zip_code_prefix': 'int32', 'geolocation_lat': 'float64',
+                  'geolocation_lng': 'float64'},
+        'categorical': ['geolocation_city', 'geolocation_state'],
+        'datetime': [],
+    },
+    'Order_items': {
+        'file': "olist_order_items_dataset.csv",
+        'columns': ['order_id', 'order_item_id', 'product_id', 'seller_id',
+                    'shipping_limit_date', 'price', 'freight_value'],
+        'dtype': {'order_item_id': 'int16', 'price': 'float64', 'freight_value': 'float64'},
+        'categorical': [],
+        'datetime': ['shipping_limit_date'],
+    },
+    'Order_Payments': {
+        'file': "olist_order_payments_dataset.csv",
+        'columns': ['order_id', 'payment_sequential', 'payment_type',
+                    'payment_installments', 'payment_value'],
+        'dtype': {'payment_sequential': 'int16', 'payment_installments': 'int16',
+                  'payment_value': 'float64'},
+        'categorical': ['payment_type'],
+        'datetime': [],
+    },
+    'Order_Reviews': {
+        'file': "olist_order_reviews_dataset.csv",
+        'columns': ['review_id', 'order_id', 'review_score', 'review_comment_title',
+                    'review_comment_message', 'review_creation_date', 'review_answer_timestamp'],
+        'dtype': {'review_score': 'int8'},
+        'categorical': [],
+        'datetime': ['review_creation_date', 'review_answer_timestamp'],
+    },
+    'Order_Status': {
+        'file': "olist_orders_dataset.csv",
+        'columns': ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp',
+                    'order_approved_at', 'order_delivered_carrier_date',
+                    'order_delivered_customer_date', 'order_estimated_delivery_date'],
+        'dtype': {},
+        'categorical': ['order_status'],
+        'datetime': ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+                     'order_delivered_customer_date', 'order_estimated_delivery_date'],
+    },
+    'Products': {
+        'file': "olist_products_dataset.csv",
+        'columns': ['product_id', 'product_category_name', 'product_name_lenght',
+                    'product_description_lenght', 'product_photos_qty', 'product_weight_g',
+                    'product_length_cm', 'product_height_cm', 'product_width_cm'],
+        'dtype': {'product_name_lenght': 'float64', 'product_description_lenght': 'float64',
+                  'product_photos_qty': 'float64', 'product_weight_g': 'float64',
+                  'product_length_cm': 'float64', 'product_height_cm': 'float64',
+                  'product_width_cm': 'float64'},
+        'categorical': ['product_category_name'],
+        'datetime': [],
+    },
+    'Sellers': {
+        'file': "olist_sellers_dataset.csv",
+        'columns': ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state'],
+        'dtype': {'seller_zip_code_prefix': 'int32'},
+        'categorical': ['seller_city', 'seller_state'],
+        'datetime': [],
+    },
+    'Product_Translations': {
+        'file': "product_category_name_translation.csv",
+        'columns': ['product_category_name', 'product_category_name_english'],
+        'dtype': {},
+        'categorical': [],
+        'datetime': [],
+    },
+    'Product_Categories': {
+        'file': "refined_product_categories.csv",
+        'columns': ['product_category_name', 'product_category_name_english', 'Category'],
+        'dtype': {},
+        'categorical': [],
+        'datetime': [],
+    },
+}
+
+
+# Defining a function to fingerprint a source file together with its schema
+
+def _cache_key(path, schema):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    # A schema change must invalidate the cache just like a data change
+    digest.update(json.dumps(schema, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+# Defining a function to parse a CSV with its declared schema
+
+def _read_csv(path, schema):
+    db = pd.read_csv(path, usecols=schema['columns'], dtype=schema['dtype'])
+    for col in schema['categorical']:
+        db[col] = db[col].astype('category')
+    for col in schema['datetime']:
+        db[col] = pd.to_datetime(db[col], errors='coerce')
+    # Keep the declared column order regardless of the order in the file
+    return db[schema['columns']]
+
+
+# Defining a function to load one table, from the columnar cache when the source is unchanged
+
+def load_table(name, data_dir=".", cache_dir=CACHE_DIR, columns=None, ids=None):
+    db = _load_table(name, data_dir, cache_dir, columns)
+    # The cache keeps the original IDs; the codes come from the shared dictionary (see ids.IdDictionary)
+    return db if ids is None else ids.encode_table(db)
+
+
+def _load_table(name, data_dir, cache_dir, columns):
+    schema = SCHEMAS[name]
+    path = os.path.join(data_dir, schema['file'])
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        # Without pyarrow there is no columnar cache, so parse the CSV every time
+        db = _read_csv(path, schema)
+        return db if columns is None else db[columns]
+
+    cache_path = os.path.join(cache_dir, f"{name}-{_cache_key(path, schema)}.parquet")
+    if os.path.exists(cache_path):
+        # Only the requested columns are read from the Parquet file
+        return pd.read_parquet(cache_path, columns=columns)
+
+    db = _read_csv(path, schema)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Drop stale copies of this table before writing the new one
+    for old in os.listdir(cache_dir):
+        if old.startswith(f"{name}-") and old.endswith(".parquet"):
+            os.remove(os.path.join(cache_dir, old))
+    tmp_path = cache_path + ".tmp"
+    db.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+    return db if columns is None else db[columns]
+
+
+# Defining a function to load several tables at once
+
+def load_tables(names=None, data_dir=".", cache_dir=CACHE_DIR, columns=None, ids=None):
+    names = list(SCHEMAS) if names is None else names
+    columns = columns or {}
+    return {name: load_table(name, data_dir, cache_dir, columns.get(name), ids) for name in names}
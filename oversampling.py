@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator
+from sklearn.neighbors import NearestNeighbors
+
+
+# SMOTE on a contiguous float32 array, for a binary label (as SMOTE(sampling_strategy=0.5) in the script):
+#   - the k-NN search over the minority class runs on n_jobs cores
+#   - continuous columns are interpolated between a minority sample and one of its k neighbours
+#   - one-hot groups (categorical_groups: lists of column positions) are never interpolated: as in SMOTENC,
+#     each new sample takes the most frequent category of the k neighbours, and the dummies count in the
+#     distance as median_std / sqrt(2) so that a different category weighs like a typical continuous gap
+# The original rows come first in the output, the synthetic rows after them. It can be used inside an
+# imblearn Pipeline or a FoldCache, so that only the training part of each CV fold is oversampled.
+
+class FastSMOTE(BaseEstimator):
+
+    def __init__(self, sampling_strategy=0.5, k_neighbors=5, categorical_groups=None, random_state=42, n_jobs=-1):
+        self.sampling_strategy = sampling_strategy
+        self.k_neighbors = k_neighbors
+        self.categorical_groups = categorical_groups
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def fit_resample(self, x, y):
+        is_sparse = sparse.issparse(x)
+        values = x.astype(np.float32).tocsr() if is_sparse else np.ascontiguousarray(x, dtype=np.float32)
+        labels = np.asarray(y)
+
+        classes, counts = np.unique(labels, return_counts=True)
+        minority = classes[np.argmin(counts)]
+        minority_rows = np.flatnonzero(labels == minority)
+        # Same number of new samples as imblearn: minority reaches sampling_strategy x majority
+        n_new = int(self.sampling_strategy * counts.max() - counts.min())
+
+        if n_new > 0:
+            new_values = self._sample(values[minority_rows], n_new)
+            if is_sparse:
+                values = sparse.vstack([values, sparse.csr_matrix(new_values)], format='csr')
+            else:
+                values = np.concatenate([values, new_values])
+            labels = np.concatenate([labels, np.full(n_new, minority, dtype=labels.dtype)])
+
+        if isinstance(x, pd.DataFrame):
+            return (pd.DataFrame(values, columns=x.columns, copy=False),
+                    pd.Series(labels, name=getattr(y, 'name', None)))
+        return values, labels
+
+    # Defining a function to generate n_new synthetic rows from the minority rows
+    def _sample(self, minority, n_new):
+        minority = minority.toarray() if sparse.issparse(minority) else minority
+        groups = [np.asarray(group, dtype=np.int64) for group in (self.categorical_groups or [])]
+        dummies = np.concatenate(groups) if groups else np.empty(0, dtype=np.int64)
+        continuous = np.setdiff1d(np.arange(minority.shape[1]), dummies)
+
+        # Distance space: continuous columns as they are, dummies scaled as in SMOTENC
+        space = minority.copy()
+        if len(dummies):
+            median_std = np.median(minority[:, continuous].std(axis=0)) if len(continuous) else 1.0
+            space[:, dummies] *= (median_std if median_std > 0 else 1.0) / np.sqrt(2)
+
+        k = min(self.k_neighbors, len(minority) - 1)
+        neighbours = NearestNeighbors(n_neighbors=k + 1, n_jobs=self.n_jobs).fit(space).kneighbors(
+            space, return_distance=False)[:, 1:]
+
+        rng = np.random.default_rng(self.random_state)
+        rows = rng.integers(0, len(minority), n_new)
+        partners = neighbours[rows, rng.integers(0, k, n_new)]
+        gaps = rng.random(n_new, dtype=np.float32)[:, None]
+
+        base = minority[rows]
+        new_values = base + gaps * (minority[partners] - base)
+        # One-hot groups: majority vote of the k neighbours, ties to the first category of the group
+        for group in groups:
+            votes = minority[neighbours[rows][:, :, None], group].sum(axis=1)
+            new_values[:, group] = 0
+            known = votes.max(axis=1) > 0
+            new_values[np.flatnonzero(known), group[votes[known].argmax(axis=1)]] = 1
+        return new_values
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+from date_features import DATE_DIFF_FEATURES
+from loading import SCHEMAS, load_tables
+
+
+# Columns of Final_database that the models use (features, label and index)
+MODEL_COLUMNS = [
+    'price', 'freight_value', 'product_payment_value', 'freight_to_price_ratio',
+    'product_name_lenght', 'product_description_lenght', 'product_photos_qty', 'seller_state',
+    'diff_approved_purchased', 'diff_customerdelivered_estimated',
+    'diff_customerdelivered_deliveredcarrier', 'diff_customerdelivered_purchase',
+    'diff_deliveredcarrier_purchase', 'diff_approved_purchased_wd',
+    'diff_customerdelivered_deliveredcarrier_wd', 'diff_deliveredcarrier_purchase_wd',
+    'payment_type_count', 'review_score', 'diff_review_creation_answer_days',
+    'customer_state', 'Category', 'total_purchase_count', 'customer_seller_distance_km',
+    'sellers_within_50km', 'order_id_product_id',
+]
+
+# Columns only used to filter rows before the model columns are selected
+FILTER_COLUMNS = ['order_status']
+
+# Columns created after the join and the columns they are computed from
+DERIVED_COLUMNS = {
+    'total_purchase_count': ['customer_unique_id', 'order_id'],
+    'product_payment_value': ['price', 'freight_value'],
+    'freight_to_price_ratio': ['freight_value', 'price'],
+    'order_id_product_id': ['order_id', 'product_id'],
+    'customer_seller_distance_km': ['customer_zip_code_prefix', 'seller_zip_code_prefix'],
+    'sellers_within_50km': ['customer_zip_code_prefix', 'seller_zip_code_prefix'],
+}
+DERIVED_COLUMNS.update({name: [end, start] for name, end, start, _, _ in DATE_DIFF_FEATURES})
+
+# Named aggregation that consolidates Order_Payments to one row per order_id (see aggregations.aggregate_by_key)
+# Only the aggregates used by the model columns are computed
+PAYMENT_AGGREGATES = {
+    'payment_sequential': ("payment_sequential", "count"),
+    'payment_installments': ("payment_installments", "mean"),
+    'payment_value': ("payment_value", "sum"),
+    'payment_type_count': ("payment_type", "nunique"),
+    'payment_installments_max': ("payment_installments", "max"),
+}
+
+# Tables built from a source table before the join:
+#   name -> (source table, key, {output column: input columns} or None when columns pass through, extra inputs)
+AGGREGATED_TABLES = {
+    'Order_Payments2': ('Order_Payments', 'order_id',
+                        {out: [col, *by] for out, (col, _, *by) in PAYMENT_AGGREGATES.items()}, []),
+    # The latest review per order is chosen on review_creation_date
+    'Order_Reviews2': ('Order_Reviews', 'order_id', None, ['review_creation_date']),
+}
+
+# Features computed on the order grain before the join (from Order_Status, the latest review and Customers)
+# and broadcast to the items by order_id; their inputs only reach Final_database if a model column needs them
+ORDER_FEATURES = ['total_purchase_count'] + [name for name, *_ in DATE_DIFF_FEATURES]
+
+# Tables that are not joined but looked up by a derived column: derived column -> (table, columns)
+LOOKUP_TABLES = {
+    # Zip prefix centroids (see geo.zip_centroids)
+    'customer_seller_distance_km': ('Geolocation', ['geolocation_zip_code_prefix', 'geolocation_lat',
+                                                    'geolocation_lng']),
+    'sellers_within_50km': ('Geolocation', ['geolocation_zip_code_prefix', 'geolocation_lat',
+                                            'geolocation_lng']),
+}
+
+# The join that builds Final_database: fact table, then (dimension table, key) in join order
+FACT_TABLE = 'Order_items'
+JOIN_STEPS = [
+    ('Products', 'product_id'),
+    ('Sellers', 'seller_id'),
+    ('Order_Status', 'order_id'),
+    ('Order_Payments2', 'order_id'),
+    ('Order_Reviews2', 'order_id'),
+    ('Customers', 'customer_id'),
+    ('Product_Categories', 'product_category_name'),
+]
+
+
+def _table_columns(name):
+    if name in AGGREGATED_TABLES:
+        source, key, outputs, _ = AGGREGATED_TABLES[name]
+        return [key] + list(outputs) if outputs is not None else SCHEMAS[source]['columns']
+    return SCHEMAS[name]['columns']
+
+
+# Defining a function to work backwards from the model columns to the columns each table must provide
+
+def prune_columns(model_columns=MODEL_COLUMNS):
+    # Every column of the joined table that the model columns depend on
+    needed, pending = set(), list(model_columns) + FILTER_COLUMNS
+    while pending:
+        col = pending.pop()
+        if col not in needed:
+            needed.add(col)
+            pending += DERIVED_COLUMNS.get(col, [])
+
+    # Walk the join backwards so keys that come from earlier tables (customer_id, product_category_name) are kept
+    plan = {}
+    for name, key in reversed(JOIN_STEPS):
+        cols = [col for col in _table_columns(name) if col != key and col in needed]
+        if cols:
+            needed.add(key)
+            plan[name] = [key] + cols
+    plan[FACT_TABLE] = [col for col in _table_columns(FACT_TABLE) if col in needed]
+
+    # Columns the aggregated tables need from their source tables
+    for name, (source, key, outputs, extra) in AGGREGATED_TABLES.items():
+        if name in plan:
+            inputs = {key, *extra}
+            for out in plan[name][1:]:
+                inputs.update(outputs[out] if outputs is not None else [out])
+            plan[source] = [col for col in SCHEMAS[source]['columns'] if col in inputs]
+
+    for col, (name, cols) in LOOKUP_TABLES.items():
+        if col in needed:
+            plan[name] = list(cols)
+
+    return plan
+
+
+# Defining a function to load only the pruned columns of each source table
+
+def load_pruned_tables(data_dir=".", model_columns=MODEL_COLUMNS, ids=None):
+    plan = prune_columns(model_columns)
+    sources = [name for name in plan if name in SCHEMAS]
+    return load_tables(sources, data_dir=data_dir, columns=plan, ids=ids)
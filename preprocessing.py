@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import json
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import StandardScaler
+
+
+# Builds the model matrix from Final_database in one pass:
+#   - numeric columns standardised (as StandardScaler), written straight into a preallocated block
+#   - categorical columns one-hot encoded into a second preallocated block (same columns as pd.get_dummies)
+#   - the label binarised with a vectorised comparison
+# The input frame is never modified.
+# With sparse=True the features are returned as a float32 CSR matrix (column names in feature_names_) and the
+# one-hot part is built from the category codes without a dense block. Every numeric value is stored in the CSR
+# matrix too (4 bytes of value and 4 of column index, as much as a float64 dense value), so it is only smaller
+# than the dense frame when the one-hot groups average more than 8 categories; HistGradientBoostingClassifier
+# does not accept it. The category vocabulary can be saved
+# and passed back in, so the dummy columns stay the same across retrains.
+
+class ModelMatrixTransformer:
+
+    def __init__(self, numeric, categorical, label='review_score', label_threshold=3,
+                 index='order_id_product_id', dummy_dtype='int64', sparse=False, vocabulary=None):
+        # A column listed twice is only scaled once
+        self.numeric = list(dict.fromkeys(numeric))
+        # categorical: column -> prefix, as in pd.get_dummies(prefix=...)
+        self.categorical = dict(categorical)
+        self.label = label
+        self.label_threshold = label_threshold
+        self.index = index
+        self.dummy_dtype = dummy_dtype
+        self.sparse = sparse
+        # vocabulary: column -> categories, e.g. from load_vocabulary
+        self.vocabulary = vocabulary
+
+    def fit(self, db):
+        self.scaler_ = StandardScaler().fit(db[self.numeric])
+
+        # Category order as pd.get_dummies: the categories of a categorical dtype, otherwise sorted values
+        self.categories_ = {}
+        for col in self.categorical:
+            if self.vocabulary is not None and col in self.vocabulary:
+                self.categories_[col] = list(self.vocabulary[col])
+            elif isinstance(db[col].dtype, pd.CategoricalDtype):
+                self.categories_[col] = list(db[col].cat.categories)
+            else:
+                self.categories_[col] = sorted(db[col].dropna().unique())
+
+        # Other columns are passed through unchanged, in their original order
+        encoded = set(self.numeric) | set(self.categorical) | {self.label, self.index}
+        self.passthrough_ = [col for col in db.columns if col not in encoded]
+        self.dense_columns_ = [col for col in db.columns
+                               if col in self.passthrough_ or col in set(self.numeric)]
+        self.dummy_columns_ = [f"{self.categorical[col]}_{value}"
+                               for col in self.categorical for value in self.categories_[col]]
+        self.feature_names_ = self.dense_columns_ + self.dummy_columns_
+        # Column positions of each one-hot group in the feature matrix
+        self.dummy_groups_ = []
+        offset = len(self.dense_columns_)
+        for col in self.categorical:
+            self.dummy_groups_.append(list(range(offset, offset + len(self.categories_[col]))))
+            offset += len(self.categories_[col])
+        return self
+
+    # Defining functions to persist the category vocabulary
+    def save_vocabulary(self, path):
+        vocabulary = {col: [value.item() if isinstance(value, np.generic) else value for value in categories]
+                      for col, categories in self.categories_.items()}
+        with open(path, 'w') as f:
+            json.dump(vocabulary, f, indent=2)
+
+    def _dense_block(self, db, dtype=np.float64):
+        n = len(db)
+        # Fortran order: each column is contiguous, which is also how pandas stores it
+        block = np.empty((n, len(self.dense_columns_)), dtype=dtype, order='F')
+        position = {col: j for j, col in enumerate(self.numeric)}
+        for j, col in enumerate(self.dense_columns_):
+            values = db[col].to_numpy(dtype=np.float64)
+            if col in position:
+                k = position[col]
+                np.subtract(values, self.scaler_.mean_[k], out=block[:, j])
+                np.divide(block[:, j], self.scaler_.scale_[k], out=block[:, j])
+            else:
+                block[:, j] = values
+        return block
+
+    # Defining a function to give the (row, column) position of every 1 of the one-hot block
+    def _dummy_positions(self, db):
+        rows, cols = [], []
+        offset = 0
+        for col in self.categorical:
+            categories = self.categories_[col]
+            codes = pd.Categorical(db[col], categories=categories).codes
+            # Unknown or missing values (-1) leave the whole group at zero, as pd.get_dummies
+            known = np.flatnonzero(codes >= 0)
+            rows.append(known)
+            cols.append(offset + codes[known])
+            offset += len(categories)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def _dummy_block(self, db):
+        block = np.zeros((len(db), len(self.dummy_columns_)), dtype=self.dummy_dtype, order='F')
+        rows, cols = self._dummy_positions(db)
+        block[rows, cols] = 1
+        return block
+
+    def _dummy_csr(self, db):
+        rows, cols = self._dummy_positions(db)
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                 shape=(len(db), len(self.dummy_columns_)))
+
+    def transform(self, db):
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+
+        index = pd.Index(db[self.index]) if self.index in db else db.index
+        if self.sparse:
+            # float32 values, as the trees cast them anyway, so each stored value costs no more than a dense one
+            x = sparse.hstack([sparse.csr_matrix(self._dense_block(db, np.float32)), self._dummy_csr(db)],
+                              format='csr', dtype=np.float32)
+        else:
+            x = pd.concat([
+                pd.DataFrame(self._dense_block(db), index=index, columns=self.dense_columns_, copy=False),
+                pd.DataFrame(self._dummy_block(db), index=index, columns=self.dummy_columns_, copy=False),
+            ], axis=1)
+        y = None
+        if self.label in db:
+            y = pd.Series((db[self.label].to_numpy() > self.label_threshold).astype('int64'),
+                          index=index, name=self.label)
+
+        _, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+        # Peak memory allocated while building the matrix, and the size of the result
+        x_bytes = (x.data.nbytes + x.indices.nbytes + x.indptr.nbytes) if self.sparse \
+            else x.memory_usage(index=False).sum()
+        self.memory_report_ = {'peak_bytes': peak - start,
+                               'output_bytes': int(x_bytes + (0 if y is None else y.nbytes))}
+        return x, y
+
+    def fit_transform(self, db):
+        return self.fit(db).transform(db)
+
+
+# Defining a function to read a vocabulary saved by ModelMatrixTransformer.save_vocabulary
+
+def load_vocabulary(path):
+    with open(path) as f:
+        return json.load(f)
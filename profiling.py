@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+# Statistics of one table, shared by the console checks and the plots
+
+@dataclass
+class TableProfile:
+    name: str
+    total_rows: int
+    missing: pd.Series          # Missing values per column
+    unique: pd.Series           # Distinct non-missing values per column
+    duplicated: pd.Series       # Same as col.duplicated().sum() per column
+    duplicated_rows: int        # Same as db.duplicated().sum()
+    approximate: bool = False
+
+    # Percentage of the total rows, as printed in the checks
+    def pct(self, counts, decimals=3):
+        return round(counts / self.total_rows * 100, decimals)
+
+    # Same layout as db.duplicated().value_counts()
+    @property
+    def row_duplicates(self):
+        counts = pd.Series({False: self.total_rows - self.duplicated_rows, True: self.duplicated_rows},
+                           name='count')
+        return counts[counts > 0]
+
+    # One row per column, as used by plot_total_missing_unique_values
+    @property
+    def stats(self):
+        return pd.DataFrame({
+            'Column': self.missing.index,
+            'Total_Rows': self.total_rows,
+            'Non_Missing_Values': (self.total_rows - self.missing).values,
+            'Unique_Values': self.unique.values,
+            'Missing_Values': self.missing.values,
+            'Duplicated_Values': self.duplicated.values,
+        })
+
+
+# Defining a function to fold per-column codes into one row key without overflowing int64
+
+def _combine_codes(key, space, codes, n_codes):
+    # Code 0 is kept for missing values so that rows with NaN in the same place still match
+    if space * (n_codes + 1) >= 2 ** 62:
+        key, uniques = pd.factorize(key)
+        space = len(uniques)
+    return key * (n_codes + 1) + (codes + 1), space * (n_codes + 1)
+
+
+# Defining a function to profile a table with exactly one factorization per column
+
+def _profile_exact(db):
+    n = len(db)
+    missing, unique, duplicated = {}, {}, {}
+    key, space = np.zeros(n, dtype=np.int64), 1
+
+    for col in db.columns:
+        codes, uniques = pd.factorize(db[col])
+        n_missing = int((codes == -1).sum())
+        missing[col] = n_missing
+        unique[col] = len(uniques)
+        # duplicated() treats every NaN after the first as a duplicate
+        duplicated[col] = n - len(uniques) - (n_missing > 0)
+        key, space = _combine_codes(key, space, codes, len(uniques))
+
+    duplicated_rows = n - len(pd.unique(key)) if n else 0
+    return missing, unique, duplicated, duplicated_rows
+
+
+# HyperLogLog sketch: approximate distinct count of 64-bit hashes in a fixed 2**p registers
+
+def _bit_length(w):
+    hi = (w >> np.uint64(32)).astype(np.float64)
+    lo = (w & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide='ignore'):
+        return np.where(hi > 0, 33 + np.floor(np.log2(hi)),
+                        np.where(lo > 0, 1 + np.floor(np.log2(lo)), 0)).astype(np.int64)
+
+
+def hll_count(hashes, p=14):
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if len(hashes) == 0:
+        return 0
+    m = 1 << p
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    rank = (64 - p) - _bit_length(rest) + 1
+
+    registers = np.zeros(m, dtype=np.int64)
+    np.maximum.at(registers, index, rank)
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int((registers == 0).sum())
+    # Linear counting is more accurate for small cardinalities
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+# Defining a function to profile a table with HyperLogLog distinct counts instead of hash tables
+
+def _profile_approximate(db, p):
+    n = len(db)
+    missing, unique, duplicated = {}, {}, {}
+
+    for col in db.columns:
+        values = db[col]
+        isna = values.isna().to_numpy()
+        n_missing = int(isna.sum())
+        present = values[~isna]
+        n_unique = min(hll_count(pd.util.hash_pandas_object(present, index=False).to_numpy(), p),
+                       len(present))
+        missing[col] = n_missing
+        unique[col] = n_unique
+        duplicated[col] = n - n_unique - (n_missing > 0)
+
+    row_hashes = pd.util.hash_pandas_object(db, index=False).to_numpy()
+    duplicated_rows = n - min(hll_count(row_hashes, p), n)
+    return missing, unique, duplicated, duplicated_rows
+
+
+def profile_table(db, db_name, approximate=False, p=14):
+    if approximate:
+        missing, unique, duplicated, duplicated_rows = _profile_approximate(db, p)
+    else:
+        missing, unique, duplicated, duplicated_rows = _profile_exact(db)
+
+    return TableProfile(
+        name=db_name,
+        total_rows=len(db),
+        missing=pd.Series(missing, dtype='int64'),
+        unique=pd.Series(unique, dtype='int64'),
+        duplicated=pd.Series(duplicated, dtype='int64'),
+        duplicated_rows=int(duplicated_rows),
+        approximate=approximate,
+    )
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+
+# Defining a function to draw the total rows, missing values and unique values of a profile on an axes
+
+def draw_profile(ax, profile):
+    total_rows = profile.total_rows
+    stats = profile.stats
+
+    # Calculate bottom positions for stacking
+    bottom_non_missing = stats['Non_Missing_Values']
+
+    # Plot Non-Missing Rows (this will form the bottom part of the bar)
+    ax.bar(stats['Column'], stats['Non_Missing_Values'], label='Duplicated Values', color='lightsteelblue', edgecolor='black')
+
+    # Plot Missing Rows on top of Non-Missing Rows
+    ax.bar(stats['Column'], stats['Missing_Values'], label='Missing Values', bottom=bottom_non_missing, color='gainsboro', edgecolor='black')
+
+    # Plot Unique Values on top of Non-Missing Rows (this segment will show within the Non-Missing Rows)
+    bars_unique = ax.bar(stats['Column'], stats['Unique_Values'], label='Unique Values', bottom=0, color='cornflowerblue', alpha=0.7, edgecolor='black')
+
+    # Add labels and title
+    ax.set_title(f'Total Rows, Duplicated, Missing, and Unique Values by Column in {profile.name}', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Column', fontsize=14)
+    ax.set_ylabel('Count', fontsize=14)
+    ax.tick_params(axis='x', labelrotation=45, labelsize=12)
+
+    # Place the legend to the right of the chart
+    ax.legend(title='Metric', fontsize=12, loc='center left', bbox_to_anchor=(1, 0.5))
+
+    # Add count and percentage labels to the bars
+    for bar, value in zip(bars_unique, stats['Unique_Values']):
+        percentage = (value / total_rows) * 100 if total_rows else 0
+        ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() / 2,
+                f'{value}\n({percentage:.2f}%)', ha='center', va='center', color='black')
+
+
+# Defining a non-interactive figure (Agg canvas, no pyplot state) reused for every table
+
+def _new_figure():
+    fig = Figure(figsize=(12, 7))
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _render_page(fig, ax, profile):
+    ax.clear()
+    draw_profile(ax, profile)
+    # Adjust layout to avoid clipping
+    fig.tight_layout()
+
+
+# Defining a function to render a batch of profiles to image files with one figure
+
+def _render_images(profiles, output_dir, fmt, dpi):
+    fig, ax = _new_figure()
+    paths = []
+    for profile in profiles:
+        _render_page(fig, ax, profile)
+        path = os.path.join(output_dir, f"{profile.name}.{fmt}")
+        fig.savefig(path, format=fmt, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+# Defining a function to render every table's profile in one call
+# output ending in .pdf -> one multi-page PDF; otherwise a folder with one image per table
+
+def render_profiles(profiles, output, fmt='png', dpi=100, n_jobs=1):
+    profiles = list(profiles)
+
+    if output.lower().endswith('.pdf'):
+        # A single PDF is written sequentially, so pages keep the order of the profiles
+        fig, ax = _new_figure()
+        with PdfPages(output) as pdf:
+            for profile in profiles:
+                _render_page(fig, ax, profile)
+                pdf.savefig(fig)
+        return [output]
+
+    os.makedirs(output, exist_ok=True)
+    if n_jobs == 1 or len(profiles) < 2:
+        return _render_images(profiles, output, fmt, dpi)
+
+    # Each worker renders every n-th table with its own figure
+    n_jobs = min(n_jobs if n_jobs > 0 else (os.cpu_count() or 1), len(profiles))
+    chunks = [profiles[i::n_jobs] for i in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        results = pool.map(_render_images, chunks, [output] * n_jobs, [fmt] * n_jobs, [dpi] * n_jobs)
+    return [path for paths in results for path in paths]
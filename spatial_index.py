@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from geo import EARTH_RADIUS_KM, ZipCentroids
+
+
+# Haversine BallTree over points given in degrees, with a label per point (e.g. zip prefix or seller_id).
+# Queries are batched: one call for any number of query points. Distances are in km.
+# Saved with joblib, its arrays can be memory-mapped by the processes that load it (mmap_mode='r').
+
+class SpatialIndex:
+
+    def __init__(self, lat, lng, labels=None, leaf_size=40):
+        points = np.radians(np.column_stack([lat, lng]).astype(np.float64))
+        self.labels = np.arange(len(points)) if labels is None else np.asarray(labels)
+        # Strings as a fixed-width array, which can be memory-mapped unlike an object array
+        if self.labels.dtype == object:
+            self.labels = self.labels.astype(str)
+        self.tree = BallTree(points, leaf_size=leaf_size, metric='haversine')
+
+    # Defining a function to digest the indexed points and labels; pickling the tree itself is not stable, as
+    # BallTree keeps query counters in its state
+    def fingerprint(self):
+        return joblib.hash((self.tree.get_arrays()[0], self.labels))
+
+    @staticmethod
+    def _radians(lat, lng):
+        return np.radians(np.column_stack([lat, lng]).astype(np.float64))
+
+    # Defining a function to find the k nearest points: (distances in km, labels), both of shape (n, k)
+    def query(self, lat, lng, k=1):
+        distances, positions = self.tree.query(self._radians(lat, lng), k=k)
+        return distances * EARTH_RADIUS_KM, self.labels[positions]
+
+    # Defining a function to count (count_only=True) or list the labels of the points within radius_km
+    def query_radius(self, lat, lng, radius_km, count_only=False):
+        result = self.tree.query_radius(self._radians(lat, lng), r=radius_km / EARTH_RADIUS_KM,
+                                        count_only=count_only)
+        return result if count_only else [self.labels[positions] for positions in result]
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        return joblib.load(path, mmap_mode=mmap_mode)
+
+
+# Defining a function to give every unknown zip prefix the centroid of the closest known prefix
+# (prefixes are assigned geographically, so numerically close prefixes are close on the map).
+# Unknown prefixes between two known ones take the nearer one, ties to the lower prefix.
+
+def fill_missing_prefixes(centroids):
+    known = centroids.known
+    prefixes = np.arange(len(centroids.lat))
+    upper = np.clip(np.searchsorted(known, prefixes), 0, len(known) - 1)
+    lower = np.clip(upper - 1, 0, len(known) - 1)
+    nearest = np.where(prefixes - known[lower] <= known[upper] - prefixes, known[lower], known[upper])
+    return ZipCentroids(centroids.lat[nearest], centroids.lng[nearest], centroids.points)
+
+
+# Defining a function to build the index of seller locations (one point per seller, at its prefix centroid)
+
+def seller_index(Sellers, centroids):
+    lat, lng = centroids.lookup(Sellers['seller_zip_code_prefix'])
+    located = ~np.isnan(lat)
+    return SpatialIndex(lat[located], lng[located], labels=Sellers['seller_id'].to_numpy()[located])
+
+
+# Defining a function to count the sellers within radius_km of each customer: one radius query for the
+# distinct customer prefixes, then one take back to the rows of db (NaN if the prefix has no centroid)
+
+def add_seller_density(db, centroids, sellers, radius_km=50, name='sellers_within_50km',
+                       customer_col='customer_zip_code_prefix'):
+    codes, prefixes = pd.factorize(db[customer_col])
+    lat, lng = centroids.lookup(prefixes)
+    counts = np.full(len(prefixes), np.nan)
+    located = np.flatnonzero(~np.isnan(lat))
+    if len(located):
+        counts[located] = sellers.query_radius(lat[located], lng[located], radius_km, count_only=True)
+    db[name] = np.where(codes >= 0, counts[codes], np.nan)
+    return db
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import pickle
+import sqlite3
+from contextlib import closing
+
+import joblib
+from hyperopt import Trials, pyll
+
+
+# Defining a function to fingerprint the tuning data, used as the run id: a rerun on the same data resumes
+# the same run, new data starts a new run seeded with the earlier ones
+
+def data_digest(*data):
+    return joblib.hash(data)
+
+
+# Defining a function to fingerprint a search space. The printed pyll graph lists every label with its
+# distribution and bounds; str() of the space itself holds object addresses that change between processes.
+
+def space_digest(space):
+    return data_digest(str(pyll.as_apply(space)))
+
+
+# SQLite store of hyperopt trials, one study per search (e.g. 'RF', 'GBDT', 'XGB').
+# Trials of earlier runs seed the search (TPE starts from their posterior) but were scored on other data, so the
+# best point is chosen among the trials of the current run only (pass run=store.run to parallel_fmin and
+# best_trial); trials of the current run are already done and are not repeated. Only trials of the same search
+# space are reused.
+
+class TrialStore:
+
+    def __init__(self, path, run):
+        self.path = path
+        self.run = run
+        with self._connect() as con, con:
+            con.execute("CREATE TABLE IF NOT EXISTS trials "
+                        "(study TEXT, space TEXT, run TEXT, tid INTEGER, doc BLOB)")
+
+    # The connection's own context manager only commits, closing() also closes it
+    def _connect(self):
+        return closing(sqlite3.connect(self.path))
+
+    # Defining a function to read the stored trials of a study; returns (trials, number of trials to run)
+    # for a search of max_evals new trials
+    def load(self, study, space, max_evals):
+        with self._connect() as con:
+            rows = con.execute("SELECT run, doc FROM trials WHERE study = ? AND space = ? ORDER BY rowid",
+                               (study, space_digest(space))).fetchall()
+        trials = Trials()
+        docs = [pickle.loads(doc) for _, doc in rows]
+        # Renumber the trials so their ids are the ids Trials would have given them, and record their run so
+        # that only the trials of this run are selected or used for pruning (see tuning.best_trial)
+        for (run, _), doc, tid in zip(rows, docs, trials.new_trial_ids(len(docs))):
+            doc['misc']['run'] = run
+            doc['tid'] = doc['misc']['tid'] = tid
+            doc['misc']['idxs'] = {label: [tid] if len(idxs) else [] for label, idxs in doc['misc']['idxs'].items()}
+        if docs:
+            trials.insert_trial_docs(docs)
+            trials.refresh()
+
+        seeds = sum(run != self.run for run, _ in rows)
+        return trials, seeds + max_evals
+
+    # Defining a function to save finished trials as soon as they are done (see parallel_fmin's checkpoint)
+    def checkpoint(self, study, space):
+        space_key = space_digest(space)
+
+        def save(docs):
+            with self._connect() as con, con:
+                con.executemany("INSERT INTO trials VALUES (?, ?, ?, ?, ?)",
+                                [(study, space_key, self.run, doc['tid'], pickle.dumps(doc)) for doc in docs])
+        return save
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import os
+import uuid
+
+import numpy as np
+import xgboost as xgb
+from hyperopt import STATUS_OK, Trials, space_eval, tpe
+from hyperopt.base import JOB_STATE_DONE, Domain
+from hyperopt.utils import coarse_utcnow
+from imblearn.pipeline import Pipeline
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.metrics import get_scorer, precision_score
+from sklearn.model_selection import HalvingRandomSearchCV, StratifiedKFold, train_test_split
+
+
+# Splitting the cores between trials run at once (processes) and CV folds inside each trial (threads)
+
+def split_cores(cv=5, n_cores=None):
+    n_cores = n_cores or os.cpu_count() or 1
+    cv_jobs = min(cv, n_cores)
+    trial_jobs = max(1, n_cores // cv_jobs)
+    return trial_jobs, cv_jobs
+
+
+# Defining a function to run one trial in a worker and return a hyperopt result
+
+def _evaluate(fn, params, history=None):
+    result = fn(params) if history is None else fn(params, history)
+    if isinstance(result, dict):
+        return result
+    return {'loss': float(result), 'status': STATUS_OK}
+
+
+# Defining a parallel version of hyperopt.fmin on a local process pool (no Spark or MongoDB needed).
+# Each round asks the algorithm for n_jobs new points from the trials so far and evaluates them at once.
+# For a given rstate and n_jobs the search is reproducible; with n_jobs=1 it follows the same points as fmin.
+# With pass_history=True fn is called as fn(params, history), history being the fold scores of the finished
+# trials, so that it can prune itself (see cross_val_result).
+# A trial only sees the trials of the earlier rounds, so with pass_history the rounds are sized against
+# startup_trials (e.g. the pruner's n_startup_trials): the first round runs startup_trials trials and each later
+# round at most as many trials as have finished (5, 5, 10, 20... up to n_jobs), so the pruner has a history
+# from the second round on even when n_jobs is larger than max_evals.
+# checkpoint, if given, is called with the finished trial documents after every round (see TrialStore).
+# run: with trials of earlier runs loaded from a TrialStore, only the trials of this run (and the new ones) give
+# the pruner's history and the best point; the others only seed the algorithm.
+
+def parallel_fmin(fn, space, max_evals, trials=None, algo=tpe.suggest, rstate=None, n_jobs=-1,
+                  pass_history=False, checkpoint=None, startup_trials=None, run=None):
+    domain = Domain(fn, space)
+    trials = Trials() if trials is None else trials
+    rstate = np.random.default_rng() if rstate is None else rstate
+
+    batch_size = effective_n_jobs(n_jobs)
+    with Parallel(n_jobs=batch_size) as parallel:
+        while len(trials.trials) < max_evals:
+            round_size = min(batch_size, max_evals - len(trials.trials))
+            if pass_history and startup_trials:
+                round_size = min(round_size, max(startup_trials, len(trials.trials)))
+            new_ids = trials.new_trial_ids(round_size)
+            trials.refresh()
+            docs = algo(new_ids, domain, trials, rstate.integers(2**31 - 1))
+            if not docs:
+                break
+
+            # Hyperparameters of each new trial, as fmin would pass them to fn
+            params = [space_eval(space, {label: values[0] for label, values in doc['misc']['vals'].items()
+                                         if len(values)})
+                      for doc in docs]
+            history = fold_history(trials, run) if pass_history else None
+            results = parallel(delayed(_evaluate)(fn, p, history) for p in params)
+
+            for doc, result in zip(docs, results):
+                doc['state'] = JOB_STATE_DONE
+                doc['result'] = result
+                doc['book_time'] = doc['refresh_time'] = coarse_utcnow()
+            trials.insert_trial_docs(docs)
+            trials.refresh()
+            if checkpoint is not None:
+                checkpoint(docs)
+
+    # Best point in the same format as fmin (indices for hp.choice), among the trials that were not pruned
+    return {label: values[0] for label, values in best_trial(trials, run)['misc']['vals'].items() if len(values)}
+
+
+# Defining a function to give the best finished trial. A pruned trial's loss is the mean of the folds it ran
+# only, so it is not comparable with full cross-validations and cannot be selected (unless every trial was pruned).
+# With run, trials of other runs (scored on other data, see TrialStore) are not selected either.
+
+def best_trial(trials, run=None):
+    finished = [trial for trial in _of_run(trials, run) if trial['result'].get('status') == STATUS_OK]
+    complete = [trial for trial in finished if not trial['result'].get('pruned', False)]
+    return min(complete or finished, key=lambda trial: trial['result']['loss'])
+
+
+# Defining a function to give the trials of one run: a trial loaded from a TrialStore records its run in
+# misc['run'], a trial run in this process has none and belongs to the current run
+
+def _of_run(trials, run=None):
+    return [trial for trial in trials.trials if run is None or trial['misc'].get('run', run) == run]
+
+
+# Defining a function to collect the fold scores of every finished trial (of one run, if given)
+
+def fold_history(trials, run=None):
+    return [trial['result']['fold_scores'] for trial in _of_run(trials, run)
+            if trial['result'].get('status') == STATUS_OK and 'fold_scores' in trial['result']]
+
+
+# Median rule: after each fold, a trial whose mean score so far is below the median of the other trials'
+# means over the same folds is abandoned. Needs n_startup_trials finished trials and min_folds folds.
+
+class MedianPruner:
+
+    def __init__(self, n_startup_trials=5, min_folds=1, margin=0.0):
+        self.n_startup_trials = n_startup_trials
+        self.min_folds = min_folds
+        self.margin = margin
+
+    def should_prune(self, scores, history):
+        n_folds = len(scores)
+        if n_folds < self.min_folds:
+            return False
+        others = [np.mean(h[:n_folds]) for h in history if len(h) >= n_folds]
+        if len(others) < self.n_startup_trials:
+            return False
+        return np.mean(scores) < np.median(others) - self.margin
+
+
+# Cross-validation data shared by every trial of every model: the folds are split once, held as contiguous
+# float32 arrays (the trees cast to float32 anyway) and, for XGBoost, quantised once per fold into
+# QuantileDMatrix objects that every trial reuses. Each worker process keeps its own DMatrix cache.
+# With a resampler (e.g. FastSMOTE) only the fitting part of each training fold is oversampled, so the test
+# folds and the early-stopping slices hold real rows only and no synthetic row is built from them.
+
+_DMATRICES = {}
+
+
+class FoldCache:
+
+    def __init__(self, x, y, cv=5, validation_fraction=0.1, random_state=1234, resampler=None):
+        x = x.astype(np.float32).tocsr() if sparse.issparse(x) else np.ascontiguousarray(x, dtype=np.float32)
+        y = np.ascontiguousarray(y)
+        self.key = uuid.uuid4().hex
+        self.folds = []
+        # Same folds as cross_val_score(cv=5) for a classifier
+        for train_index, test_index in StratifiedKFold(n_splits=cv).split(x, y):
+            x_train, y_train = x[train_index], y[train_index]
+            # Positions within the training fold kept aside for early stopping
+            fit_pos, stop_pos = train_test_split(np.arange(len(train_index)), test_size=validation_fraction,
+                                                 random_state=random_state, stratify=y_train)
+            fit_pos, stop_pos = np.sort(fit_pos), np.sort(stop_pos)
+            if resampler is not None:
+                # Only the fitting rows are oversampled, so no synthetic row is interpolated from an early-stopping
+                # row; the resampler returns the original rows first, the synthetic rows are appended to the fold
+                x_fit, y_fit = resampler.fit_resample(x_train[fit_pos], y_train[fit_pos])
+                synthetic = slice(len(fit_pos), len(y_fit))
+                x_train = sparse.vstack([x_train, x_fit[synthetic]], format='csr') if sparse.issparse(x_train) \
+                    else np.concatenate([x_train, np.asarray(x_fit[synthetic], dtype=np.float32)])
+                y_train = np.concatenate([y_train, np.asarray(y_fit)[synthetic]])
+                fit_pos = np.concatenate([fit_pos, np.arange(len(train_index), len(y_train))])
+            self.folds.append((x_train, np.asarray(y_train), x[test_index], y[test_index], fit_pos, stop_pos))
+
+    def __len__(self):
+        return len(self.folds)
+
+    # Defining a function to give (x_train, y_train, x_test, y_test) of one fold
+    def fold(self, i):
+        return self.folds[i][:4]
+
+    # Defining a function to give (x_fit, y_fit, x_stop, y_stop, x_test, y_test) of one fold: the training fold
+    # split into its fitting rows (with the synthetic rows) and its real early-stopping rows
+    def early_stopping_fold(self, i):
+        x_train, y_train, x_test, y_test, fit_pos, stop_pos = self.folds[i]
+        return x_train[fit_pos], y_train[fit_pos], x_train[stop_pos], y_train[stop_pos], x_test, y_test
+
+    # Defining a function to give the (fit, early stopping, test) DMatrix of one fold, built once per process
+    def dmatrices(self, i, max_bin=256):
+        key = (self.key, i, max_bin)
+        if key not in _DMATRICES:
+            x_train, y_train, x_test, y_test, fit_pos, stop_pos = self.folds[i]
+            dfit = xgb.QuantileDMatrix(x_train[fit_pos], y_train[fit_pos], max_bin=max_bin)
+            dstop = xgb.QuantileDMatrix(x_train[stop_pos], y_train[stop_pos], ref=dfit)
+            dtest = xgb.QuantileDMatrix(x_test, y_test, ref=dfit)
+            _DMATRICES[key] = (dfit, dstop, dtest)
+        return _DMATRICES[key]
+
+
+# Early stopping of a GradientBoostingClassifier on the cached early-stopping rows of a fold, passed to
+# fit(..., monitor=...). Same rule as its n_iter_no_change (stop once the log loss on the slice has not improved
+# by more than tol for n_iter_no_change stages), which would otherwise validate on a random part of the
+# oversampled training rows, synthetic rows included.
+
+class StopSliceMonitor:
+
+    def __init__(self, x_stop, y_stop, n_iter_no_change=20, tol=1e-4):
+        self.x_stop = x_stop
+        self.y_stop = y_stop
+        self.n_iter_no_change = n_iter_no_change
+        self.tol = tol
+
+    def __call__(self, i, estimator, _locals):
+        if i == 0:
+            # The slice's raw predictions, one stage at a time as the stages are fitted
+            self._raw_predictions = estimator.staged_decision_function(self.x_stop)
+            self._positive = (np.asarray(self.y_stop) == estimator.classes_[1]).astype(np.float64)
+            self._loss_history = np.full(self.n_iter_no_change, np.inf)
+        raw = next(self._raw_predictions).ravel()
+        loss = np.mean(np.logaddexp(0, raw) - self._positive * raw)
+        if np.any(loss + self.tol < self._loss_history):
+            self._loss_history[i % self.n_iter_no_change] = loss
+            return False
+        return True
+
+
+# Defining a function to stop the cross-validation of a trial once the pruner gives up on it
+
+def _prune(scores, history, pruner):
+    return pruner is not None and bool(history) and pruner.should_prune(scores, history)
+
+
+# Defining a function to add the number of boosting rounds kept by early stopping to a hyperopt result: the
+# mean over the scored folds, so that the final model is refitted with the trees that were scored
+
+def _with_iterations(result, iterations):
+    if iterations:
+        result['best_n_estimators'] = max(1, int(round(np.mean(iterations))))
+    return result
+
+
+# Defining a cross-validation that scores the cached folds one by one and stops as soon as the pruner gives
+# up on the trial. With early_stopping_rounds, a GradientBoostingClassifier is early-stopped on the fold's
+# early-stopping rows (see StopSliceMonitor), as XGBoost is in xgb_cross_val_result.
+# Returns a hyperopt result, with best_n_estimators for an early-stopped boosting model.
+
+def cross_val_result(estimator, folds, scoring='precision_macro', history=None, pruner=None,
+                     early_stopping_rounds=None):
+    scorer = get_scorer(scoring)
+    scores, iterations, pruned = [], [], False
+    for i in range(len(folds)):
+        if early_stopping_rounds is None:
+            x_train, y_train, x_test, y_test = folds.fold(i)
+            clf = clone(estimator).fit(x_train, y_train)
+        else:
+            # GradientBoostingClassifier fitted on the fitting rows, stopped on the fold's early-stopping rows
+            x_fit, y_fit, x_stop, y_stop, x_test, y_test = folds.early_stopping_fold(i)
+            clf = clone(estimator).fit(x_fit, y_fit,
+                                       monitor=StopSliceMonitor(x_stop, y_stop, early_stopping_rounds))
+        scores.append(float(scorer(clf, x_test, y_test)))
+        # Rounds kept by early stopping (GradientBoostingClassifier / HistGradientBoostingClassifier)
+        if hasattr(clf, 'n_estimators_') or hasattr(clf, 'n_iter_'):
+            iterations.append(getattr(clf, 'n_estimators_', None) or clf.n_iter_)
+        if _prune(scores, history, pruner):
+            pruned = True
+            break
+
+    result = {'loss': -np.mean(scores), 'status': STATUS_OK, 'fold_scores': scores, 'pruned': pruned}
+    return _with_iterations(result, iterations)
+
+
+# Same for XGBoost with the native API on the cached DMatrix objects. params are XGBClassifier parameters;
+# n_estimators is an upper bound, boosting stops after early_stopping_rounds rounds without improvement on
+# the early-stopping slice of the training fold. Only precision_macro is supported as scoring.
+
+def xgb_cross_val_result(params, folds, early_stopping_rounds=20, history=None, pruner=None):
+    params = dict(params)
+    num_boost_round = params.pop('n_estimators', 100)
+    if 'random_state' in params:
+        params['seed'] = params.pop('random_state')
+    if 'n_jobs' in params:
+        params['nthread'] = params.pop('n_jobs')
+    params.setdefault('eval_metric', 'error' if params.get('objective') == 'binary:hinge' else 'logloss')
+    params.setdefault('tree_method', 'hist')
+
+    scores, iterations, pruned = [], [], False
+    for i in range(len(folds)):
+        dfit, dstop, dtest = folds.dmatrices(i)
+        booster = xgb.train(params, dfit, num_boost_round=num_boost_round, evals=[(dstop, 'stop')],
+                            early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+        predictions = booster.predict(dtest, iteration_range=(0, booster.best_iteration + 1))
+        if params.get('objective') != 'binary:hinge':
+            predictions = predictions > 0.5
+        scores.append(float(precision_score(dtest.get_label(), predictions.astype(np.float32),
+                                            average='macro', zero_division=0)))
+        iterations.append(booster.best_iteration + 1)
+        if _prune(scores, history, pruner):
+            pruned = True
+            break
+
+    result = {'loss': -np.mean(scores), 'status': STATUS_OK, 'fold_scores': scores, 'pruned': pruned}
+    return _with_iterations(result, iterations)
+
+
+# Successive-halving random search: n_candidates configurations start on a small budget (a fraction of the
+# rows with resource='n_samples', or few trees with resource='n_estimators') and only the best 1/factor of
+# each round is promoted to a factor times larger budget. Candidates of a round are fitted in parallel.
+# A hyperparameter used as the resource is set by the budget, so it is dropped from the search space.
+# With a resampler the model is searched as an imblearn Pipeline (resampler, model), so every CV fold is
+# oversampled on its training part only.
+# Returns the fitted search; best_estimator_ is already refitted on all of x, y.
+
+def halving_search(algo, hyperparameters, x, y, n_candidates=60, factor=3, resource='n_samples',
+                   min_resources='exhaust', max_resources='auto', cv=5, scoring='precision_macro',
+                   random_state=2024, n_jobs=-1, resampler=None):
+    hyperparameters = {name: values for name, values in hyperparameters.items() if name != resource}
+    if resampler is not None:
+        algo, hyperparameters = with_resampler(algo, hyperparameters, resampler)
+        resource = resource if resource == 'n_samples' else f"model__{resource}"
+    search = HalvingRandomSearchCV(algo, hyperparameters, n_candidates=n_candidates, factor=factor,
+                                   resource=resource, min_resources=min_resources,
+                                   max_resources=max_resources, cv=cv, scoring=scoring, refit=True,
+                                   random_state=random_state, n_jobs=n_jobs)
+    return search.fit(x, y)
+
+
+# Defining a function to put a resampler in front of a model, with the search space renamed for the pipeline
+
+def with_resampler(algo, hyperparameters, resampler):
+    pipeline = Pipeline([('resampler', resampler), ('model', algo)])
+    return pipeline, {f"model__{name}": values for name, values in hyperparameters.items()}
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+@author: Group 41
+
+"""
+
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# Defining the Brazilian national holidays, including the movable feasts tied to Easter
+
+def _easter_sunday(year):
+    # Anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def brazil_national_holidays(years):
+    holidays = []
+    for year in years:
+        easter = _easter_sunday(year)
+        holidays += [
+            datetime.date(year, 1, 1),                # Confraternização Universal
+            easter - datetime.timedelta(days=48),     # Carnaval (Monday)
+            easter - datetime.timedelta(days=47),     # Carnaval (Tuesday)
+            easter - datetime.timedelta(days=2),      # Sexta-feira Santa
+            datetime.date(year, 4, 21),               # Tiradentes
+            datetime.date(year, 5, 1),                # Dia do Trabalho
+            easter + datetime.timedelta(days=60),     # Corpus Christi
+            datetime.date(year, 9, 7),                # Independência
+            datetime.date(year, 10, 12),              # Nossa Senhora Aparecida
+            datetime.date(year, 11, 2),               # Finados
+            datetime.date(year, 11, 15),              # Proclamação da República
+            datetime.date(year, 12, 25),              # Natal
+        ]
+    return np.array(sorted(set(holidays)), dtype='datetime64[D]')
+
+
+# Defining a function to build the working-day calendar (Monday to Friday, minus the holidays), built once and
+# shared by every working-day feature
+
+def working_day_calendar(holidays=None):
+    return np.busdaycalendar(holidays=[] if holidays is None else holidays)
+
+
+# Defining a function to calculate the number of working days between two timestamp columns at once
+
+def working_days_between(start, end, holidays=None, busdaycal=None):
+    # Truncate both columns to calendar days, as calculate_working_days did with .date()
+    start = pd.to_datetime(pd.Series(start)).to_numpy(dtype='datetime64[D]')
+    end = pd.to_datetime(pd.Series(end)).to_numpy(dtype='datetime64[D]')
+
+    # Handle missing values with a mask rather than per row
+    valid = ~(np.isnat(start) | np.isnat(end))
+
+    # A prebuilt calendar avoids re-sorting the holiday list on every call
+    if busdaycal is None:
+        busdaycal = working_day_calendar(holidays)
+
+    result = np.full(len(start), np.nan)
+    result[valid] = np.busday_count(start[valid], end[valid], busdaycal=busdaycal)
+    return result
+
+
+# Defining the working-day features as (name, start column, end column); they are computed with the other
+# gap features (see date_features.DATE_DIFF_FEATURES)
+
+WORKING_DAY_FEATURES = [
+    ('diff_approved_purchased_wd', 'order_purchase_timestamp', 'order_approved_at'),
+    ('diff_customerdelivered_deliveredcarrier_wd', 'order_delivered_carrier_date', 'order_delivered_customer_date'),
+    ('diff_deliveredcarrier_purchase_wd', 'order_purchase_timestamp', 'order_delivered_carrier_date'),
+]